@@ -0,0 +1,392 @@
+"""
+Headless benchmark suite for ImageInspector.
+
+Measures decode time, time to first paint, per-frame paint latency while
+panning and zooming, and peak resident memory, using synthetic images
+from 1 MP up to 100+ MP with and without alpha. Each case runs in its own
+process so that peak RSS is measured per case, and the standalone decode
+timings run in another so that peak RSS is the viewer's alone. A startup
+case measures the import time of image_inspector (and which heavy
+dependencies the import pulled in) and the time from view() to the first
+paint.
+
+Needs a display, but not a GPU. On a headless Linux box run it under
+Xvfb:
+
+    xvfb-run -a python benchmarks.py --output results.json
+
+and compare two runs (e.g. before and after a change) with
+
+    python benchmarks.py --compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from PIL import Image as PILImage
+
+
+
+
+### Settings ---------------------------------------------------------------
+
+DEFAULT_SIZES_MP = (1, 4, 16, 64, 100)
+DEFAULT_VIEWPORT = (1280, 800)
+PAN_STEPS = 120
+PAN_STEP = (9, 5) # Pixels moved per simulated motion event
+ZOOM_STEPS = 6
+STARTUP_RUNS = 5 # Fresh interpreters timed for the import benchmark
+HEAVY_MODULES = ('numpy', 'PIL.Image', 'requests')
+
+
+
+
+### Synthetic images -------------------------------------------------------
+
+def _make_image(megapixels, alpha, directory):
+    """ Write a synthetic test image and return its path.
+    A smooth gradient with a fine checker pattern on top, so that both
+    JPEG and PNG have real work to do. Opaque images are saved as JPEG,
+    images with alpha as PNG.
+    """
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(megapixels * 1e6 / width)
+    ext = 'png' if alpha else 'jpg'
+    path = os.path.join(directory, f'synthetic_{megapixels}mp_{width}x{height}.{ext}')
+    if os.path.exists(path):
+        return path
+
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    checker = ((np.arange(width) // 8 + np.arange(height)[:, None] // 8) % 2) * 32
+    red = (x + checker) % 256
+    green = (y + checker) % 256
+    blue = ((x + y) / 2 + checker) % 256
+    channels = [red, green, blue]
+    if alpha:
+        channels.append(np.broadcast_to(255 - y * 0.5, (height, width)))
+    pixels = np.dstack([np.broadcast_to(c, (height, width)) for c in channels])
+    image = PILImage.fromarray(pixels.astype(np.uint8),
+                               'RGBA' if alpha else 'RGB')
+    if alpha:
+        image.save(path)
+    else:
+        image.save(path, quality=90)
+    return path
+
+
+
+
+### Measurements -----------------------------------------------------------
+
+def _percentiles(samples):
+    """ Summarise latency samples (seconds) as millisecond percentiles """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {'count': len(ordered),
+            'p50_ms': pick(0.50) * 1000,
+            'p90_ms': pick(0.90) * 1000,
+            'p99_ms': pick(0.99) * 1000,
+            'max_ms': ordered[-1] * 1000}
+
+
+def _peak_rss_mb():
+    """ Peak resident set size of this process in MB """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': # Bytes on macOS, KB elsewhere
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def _time_decodes(path, viewport):
+    """ Time the loader's reduced and full resolution decodes (in a child
+    process of their own, so they don't count towards the viewer's peak
+    RSS) """
+    import image_inspector
+
+    start = time.perf_counter()
+    image_inspector._decode_reduced(path, path, viewport)
+    reduced = time.perf_counter() - start
+
+    start = time.perf_counter()
+    image_inspector._decode_full(path, path)
+    full = time.perf_counter() - start
+    return {'decode_reduced_s': reduced, 'decode_full_s': full}
+
+
+def _wait_for(condition, timeout=300):
+    """ Run the wx event loop until condition() is true """
+    import wx
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError('Benchmark step timed out')
+        wx.GetApp().Yield(True)
+        time.sleep(0.001)
+
+
+def _paint(viewer):
+    """ Force a synchronous repaint and return how long it took """
+    start = time.perf_counter()
+    viewer.Refresh()
+    viewer.Update()
+    return time.perf_counter() - start
+
+
+def _run_pan(viewer):
+    """ Drag diagonally across the image one motion event at a time """
+    samples = []
+    viewer.view.begin_pan(0, 0)
+    for step in range(1, PAN_STEPS + 1):
+        viewer._process_pan(-PAN_STEP[0] * step, -PAN_STEP[1] * step, False)
+        samples.append(_paint(viewer))
+    viewer._finish_pan(False)
+    return samples
+
+
+def _run_zoom(viewer):
+    """ Zoom in step by step, then back out again """
+    samples = []
+    for _ in range(ZOOM_STEPS):
+        viewer._on_zoom_in_button(None)
+        samples.append(_paint(viewer))
+    for _ in range(ZOOM_STEPS):
+        viewer._on_zoom_out_button(None)
+        samples.append(_paint(viewer))
+    return samples
+
+
+def _run_case(path, viewport):
+    """ Run the viewer measurements for one image (in a child process) """
+    result = {'image': os.path.basename(path)}
+
+    import wx
+    import image_inspector
+
+    app = wx.App(False)
+    wx.InitAllImageHandlers()
+    start = time.perf_counter()
+    frame = wx.Frame(None, size=viewport)
+    panel = image_inspector.ImageInspectorPanel(image_file=path,
+                                                parent=frame)
+    frame.Show()
+    viewer = panel.viewer_panel
+    _wait_for(lambda: viewer.image is not None and viewer.load_job is None)
+    _paint(viewer)
+    result['first_paint_s'] = time.perf_counter() - start
+
+    result['pan'] = _percentiles(_run_pan(viewer))
+    result['zoom'] = _percentiles(_run_zoom(viewer))
+    result['peak_rss_mb'] = _peak_rss_mb()
+
+    frame.Destroy()
+    app.Yield(True)
+    return result
+
+
+def _run_import():
+    """ Time importing image_inspector in a fresh interpreter and note
+    which heavy dependencies it actually loaded (in a child process) """
+    start = time.perf_counter()
+    import image_inspector
+    elapsed = time.perf_counter() - start
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    return {'import_s': elapsed, 'loaded_modules': loaded}
+
+
+def _run_view_to_paint(path):
+    """ Time from view() being called to the first paint of the image
+    (in a child process) """
+    import wx
+    import image_inspector
+
+    app = wx.App(False)
+    host = wx.Frame(None)
+    painted = []
+    image_inspector.enable_instrumentation()
+    image_inspector.set_instrumentation_callback(
+        lambda stage, seconds: stage == 'paint.frame' and painted.append(
+            time.perf_counter()))
+
+    start = time.perf_counter()
+    image_inspector.view(host, path)
+    view_returned = time.perf_counter() - start
+    _wait_for(lambda: painted)
+    result = {'view_return_s': view_returned,
+              'view_to_first_paint_s': painted[0] - start}
+
+    host.Destroy()
+    app.Yield(True)
+    return result
+
+
+
+
+### Driver -----------------------------------------------------------------
+
+def _git_revision():
+    """ Current commit of the working tree, if it is a git checkout """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_child(*args):
+    """ Run this script in a fresh interpreter and return its JSON result """
+    child = subprocess.run([sys.executable, os.path.abspath(__file__)]
+                           + list(args), capture_output=True, text=True)
+    if child.returncode != 0:
+        return {'error': child.stderr.strip()[-2000:]}
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def run_startup(image_path):
+    """ Benchmark import time (median of STARTUP_RUNS fresh interpreters)
+    and the time from view() to the first paint of image_path """
+    imports = [_run_child('--run-import') for _ in range(STARTUP_RUNS)]
+    times = sorted(run['import_s'] for run in imports if 'import_s' in run)
+    result = {'image': 'startup'}
+    if times:
+        result['import_s'] = times[len(times) // 2]
+        result['loaded_modules'] = imports[0].get('loaded_modules', [])
+    result.update(_run_child('--run-view', image_path))
+    return result
+
+
+def run_suite(sizes_mp, viewport, image_dir, startup=True):
+    """ Benchmark each size with and without alpha, one process per case """
+    os.makedirs(image_dir, exist_ok=True)
+    cases = []
+    for megapixels in sizes_mp:
+        for alpha in (False, True):
+            path = _make_image(megapixels, alpha, image_dir)
+            print(f'Benchmarking {os.path.basename(path)}...', file=sys.stderr)
+            case = {'image': os.path.basename(path),
+                    'megapixels': megapixels, 'alpha': alpha}
+            viewport_arg = f'{viewport[0]}x{viewport[1]}'
+            case.update(_run_child('--run-decodes', path,
+                                   '--viewport', viewport_arg))
+            case.update(_run_child('--run-case', path,
+                                   '--viewport', viewport_arg))
+            cases.append(case)
+
+    if startup:
+        print('Benchmarking startup...', file=sys.stderr)
+        smallest = _make_image(min(sizes_mp), False, image_dir)
+        cases.append(run_startup(smallest))
+
+    return {'revision': _git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'viewport': list(viewport),
+            'cases': cases}
+
+
+def _flatten(case, prefix=''):
+    """ Flatten nested result dicts into {'pan.p50_ms': value, ...} """
+    flat = {}
+    for key, value in case.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(before_file, after_file):
+    """ Print the relative change of every metric between two runs """
+    with open(before_file, encoding='utf-8') as file:
+        before = {case['image']: case for case in json.load(file)['cases']}
+    with open(after_file, encoding='utf-8') as file:
+        after = {case['image']: case for case in json.load(file)['cases']}
+
+    for image in sorted(set(before) & set(after)):
+        print(image)
+        old, new = _flatten(before[image]), _flatten(after[image])
+        for metric in sorted(set(old) & set(new)):
+            if metric == 'megapixels':
+                continue
+            change = ((new[metric] - old[metric]) / old[metric] * 100
+                      if old[metric] else 0.0)
+            print(f'  {metric:<24} {old[metric]:>12.3f} -> '
+                  f'{new[metric]:>12.3f}  ({change:+.1f}%)')
+
+
+def _parse_viewport(text):
+    """ Parse WIDTHxHEIGHT """
+    width, height = text.lower().split('x')
+    return (int(width), int(height))
+
+
+def main():
+    """ Command line entry point """
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', type=float, nargs='+',
+                        default=DEFAULT_SIZES_MP,
+                        help='image sizes to test, in megapixels')
+    parser.add_argument('--viewport', type=_parse_viewport,
+                        default=DEFAULT_VIEWPORT, help='WIDTHxHEIGHT')
+    parser.add_argument('--image-dir',
+                        default=os.path.join(tempfile.gettempdir(),
+                                             'image_inspector_bench'),
+                        help='where synthetic images are kept between runs')
+    parser.add_argument('--output', default='bench_output.json',
+                        help='file to write JSON results to')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two result files instead of running')
+    parser.add_argument('--startup-only', action='store_true',
+                        help='only benchmark import and view() startup')
+    parser.add_argument('--no-startup', action='store_true',
+                        help='skip the startup benchmark')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('--run-decodes', help=argparse.SUPPRESS)
+    parser.add_argument('--run-view', help=argparse.SUPPRESS)
+    parser.add_argument('--run-import', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.run_case:
+        print(json.dumps(_run_case(args.run_case, args.viewport)))
+    elif args.run_decodes:
+        print(json.dumps(_time_decodes(args.run_decodes, args.viewport)))
+    elif args.run_view:
+        print(json.dumps(_run_view_to_paint(args.run_view)))
+    elif args.run_import:
+        print(json.dumps(_run_import()))
+    else:
+        sizes = [min(args.sizes)] if args.startup_only else args.sizes
+        if args.startup_only:
+            os.makedirs(args.image_dir, exist_ok=True)
+            results = {'revision': _git_revision(),
+                       'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'cases': [run_startup(_make_image(sizes[0], False,
+                                                         args.image_dir))]}
+        else:
+            results = run_suite(sizes, args.viewport, args.image_dir,
+                                startup=not args.no_startup)
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f'Results written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
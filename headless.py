@@ -0,0 +1,130 @@
+"""
+Render ImageInspector views to NumPy arrays without a display.
+
+The fit, pan and zoom geometry is the widget's own (see view_transform.py),
+so for the same viewport size, zoom and pan the image lands in the same
+place as it does on screen. Zoomed out views are drawn from a pyramid of
+halved levels chosen the same way as the widget's. Only the geometry is
+shared: pixels are resampled with PIL's bilinear filter rather than a wx
+GraphicsContext, and transparency is flattened onto background rather
+than the panel's colour, so the output is not pixel identical to the
+widget. Needs Pillow and NumPy, but not wx.
+
+    import headless
+    pixels = headless.render_view('images/medium.jpg', (400, 300),
+                                  zoom=2, pan=(150, 100))
+"""
+
+try:
+    from .view_transform import (ViewTransform, fit_position, fit_size,
+                                 pyramid_level)
+except ImportError: # Imported as a top level module rather than a package
+    from view_transform import (ViewTransform, fit_position, fit_size,
+                                pyramid_level)
+
+
+
+
+# Colour of the viewport outside the image, and under any transparency,
+# as RGB
+BACKGROUND = (0, 0, 0)
+
+
+def render_view(image, viewport_size, zoom=1, pan=(0, 0),
+                background=BACKGROUND):
+    """ Render one view of image.
+
+    image is a file path, a PIL image or an (H, W) or (H, W, C) uint8
+    array. viewport_size is the (width, height) of the panel, zoom its
+    zoom factor and pan its (x, y) pan in screen pixels, as held by the
+    widget's ViewTransform. Returns an (height, width, 3) uint8 array.
+    """
+    return render_views(image, [(viewport_size, zoom, pan)], background)[0]
+
+
+def render_views(image, views, background=BACKGROUND):
+    """ Render several views of one image.
+
+    views is an iterable of (viewport_size, zoom, pan) tuples, as taken
+    by render_view. The image is opened and converted once, and each
+    pyramid level is built once, for the whole batch. Returns a list of
+    arrays in the same order as views.
+    """
+    import numpy as np
+    levels = _Levels(_open_rgb(image, background))
+    return [np.asarray(_render(levels, viewport_size, zoom, pan, background))
+            for viewport_size, zoom, pan in views]
+
+
+
+
+### Helpers -----------------------------------------------------------------
+
+class _Levels:
+    """ Pyramid levels of a PIL image, built when first needed.
+    Matches _ImagePyramid: each level is the one below box averaged to
+    half its width and height, rounded down. """
+    def __init__(self, image):
+        self.size = image.size
+        self.max_level = max(0, min(image.size).bit_length() - 1)
+        self._levels = [image]
+
+
+    def get(self, level):
+        """ Return the PIL image for level """
+        from PIL import Image as PILImage
+        level = max(0, min(level, self.max_level))
+        while len(self._levels) <= level:
+            finer = self._levels[-1]
+            self._levels.append(finer.resize(
+                (max(1, finer.width // 2), max(1, finer.height // 2)),
+                PILImage.BOX))
+        return self._levels[level]
+
+
+def _open_rgb(image, background):
+    """ Get image as an RGB PIL image, with any transparency flattened
+    onto background """
+    import numpy as np
+    from PIL import Image as PILImage
+    if isinstance(image, np.ndarray):
+        image = PILImage.fromarray(image)
+    elif not isinstance(image, PILImage.Image):
+        image = PILImage.open(image)
+
+    if image.mode == 'RGB':
+        return image
+    if image.mode == 'P' and 'transparency' in image.info:
+        image = image.convert('RGBA')
+    if 'A' not in image.getbands():
+        return image.convert('RGB')
+    flat = PILImage.new('RGB', image.size, background)
+    flat.paste(image.convert('RGBA'), mask=image.getchannel('A'))
+    return flat
+
+
+def _render(levels, viewport_size, zoom, pan, background):
+    """ Render one view from levels as a PIL image """
+    from PIL import Image as PILImage
+    image_width, image_height = levels.size
+    scaled_img_dims = fit_size(levels.size, viewport_size)
+    start_x, start_y = fit_position(scaled_img_dims, viewport_size)
+
+    view = ViewTransform()
+    view.set_placement(start_x, start_y, scaled_img_dims[0] / image_width)
+    view.zoom_factor = zoom
+    view.pan_x, view.pan_y = pan
+
+    display_scale = zoom * view.fit_scale
+    level_image = levels.get(pyramid_level(display_scale, levels.max_level))
+
+    # PIL maps each output pixel back to the input, so give it the
+    # screen to level pixel transform
+    level_x = level_image.width / image_width
+    level_y = level_image.height / image_height
+    left, top = view.screen_to_image(0, 0)
+    coeffs = (level_x / display_scale, 0, left * level_x,
+              0, level_y / display_scale, top * level_y)
+    return level_image.transform(tuple(viewport_size), PILImage.AFFINE,
+                                 coeffs, resample=PILImage.BILINEAR,
+                                 fillcolor=tuple(background))
@@ -2,20 +2,2119 @@
 Image viewer with a pan and zoom mechanism comparable to Google Maps.
 
 This script is designed to be portable into a larger GUI application.
-Simply import this module into your script and call
+Copy this module and view_transform.py (the pan and zoom geometry it
+imports) next to your script, import this module and call
 image_inspector.view(self, image_file) where image_file is a string
 representing the relative file path of the image you wish to display.\n
 """
 
+import bisect
+import contextlib
+import glob
+import hashlib
+import json
+import logging
+import math
 import os
+import queue
 import sys
+import tempfile
+import threading
+import time
+import weakref
 
-import requests
 import wx
-import numpy as np
 
-from io import BytesIO
-from PIL import Image as PILImage
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+try:
+    from .view_transform import (ViewTransform, fit_position, fit_size,
+                                 pyramid_level)
+except ImportError: # Imported as a top level module rather than a package
+    from view_transform import (ViewTransform, fit_position, fit_size,
+                                pyramid_level)
+
+
+_log = logging.getLogger(__name__)
+
+
+
+
+# Upper bound on memory held by the downsampled levels of one image pyramid
+PYRAMID_MAX_BYTES = 256 * 1024 * 1024
+
+# Highest rate a _ViewerPanel repaints at while being panned or zoomed
+TARGET_FPS = 60
+
+# Side length in pixels of the square tiles images are drawn in
+TILE_SIZE = 512
+
+# Upper bound on memory held by one panel's cached tile bitmaps
+RENDER_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# How far from a whole number of pixels a pan delta may be and still be
+# treated as one when scrolling the last frame
+SCROLL_TOLERANCE = 1e-6
+
+# Interpolation used while the view is being panned or zoomed, and once
+# input has been idle for IDLE_REPAINT_MS (when the view is drawn again)
+INTERACTIVE_QUALITY = wx.INTERPOLATION_FAST
+IDLE_QUALITY = wx.INTERPOLATION_BEST
+IDLE_REPAINT_MS = 200
+
+# How many pyramid levels coarser than needed to draw from while the view
+# is being panned or zoomed. 0 keeps the same level and only lowers the
+# interpolation quality.
+INTERACTIVE_LEVEL_OFFSET = 0
+
+
+
+
+### Instrumentation ---------------------------------------------------------
+
+# Upper bounds (ms) of the histogram buckets stage timings are counted in
+HISTOGRAM_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250,
+                       500, 1000, float('inf'))
+
+# Whether new _ViewerPanels draw the FPS/frame cost overlay
+DEBUG_OVERLAY = False
+
+
+class _Histogram:
+    """ Bucketed timings of one stage """
+    def __init__(self):
+        self.buckets = [0] * len(HISTOGRAM_BOUNDS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+
+    def add(self, seconds):
+        """ Count one timing """
+        ms = seconds * 1000
+        self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.last = ms
+
+
+    def snapshot(self):
+        """ Return the timings as a plain dict (in milliseconds) """
+        return {'count': self.count, 'total_ms': self.total,
+                'mean_ms': self.total / self.count if self.count else 0.0,
+                'max_ms': self.max, 'last_ms': self.last,
+                'buckets': dict(zip(HISTOGRAM_BOUNDS_MS, self.buckets))}
+
+
+class _Instrumentation:
+    """ Optional timing of the viewer's hot paths.
+
+    Off by default. While off, _timed() hands back one shared do-nothing
+    context manager, so an instrumented stage costs one attribute lookup.
+    While on, each stage's timings go into a _Histogram and are passed to
+    the callback (if set) as callback(stage, seconds). Stages may be
+    timed from loader threads as well as the main thread.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.callback = None
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+
+    def record(self, stage, seconds):
+        """ Add a timing for stage """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = _Histogram()
+            histogram.add(seconds)
+        if self.callback is not None:
+            self.callback(stage, seconds)
+
+
+    def snapshot(self):
+        """ Return every stage's timings as a dict """
+        with self._lock:
+            return {stage: histogram.snapshot()
+                    for stage, histogram in self._histograms.items()}
+
+
+    def reset(self):
+        """ Forget all timings """
+        with self._lock:
+            self._histograms.clear()
+
+
+class _StageTimer:
+    """ Context manager recording how long its block took """
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+
+    def __exit__(self, *exc_info):
+        _instrumentation.record(self.stage, time.perf_counter() - self.start)
+
+
+_instrumentation = _Instrumentation()
+_NOT_TIMED = contextlib.nullcontext()
+
+
+def _timed(stage):
+    """ Time a block as stage, if instrumentation is on """
+    if not _instrumentation.enabled:
+        return _NOT_TIMED
+    return _StageTimer(stage)
+
+
+def enable_instrumentation(enabled=True):
+    """ Turn timing of load, paint and event handling stages on or off """
+    _instrumentation.enabled = enabled
+
+
+def instrumentation_stats():
+    """ Get count/mean/max and a millisecond histogram for every stage.
+    Stages are load.fetch, load.decode, load.convert, load.region,
+    paint.frame, paint.draw, paint.convert, event.motion and
+    event.zoom_gesture. """
+    return _instrumentation.snapshot()
+
+
+def reset_instrumentation():
+    """ Clear all recorded timings """
+    _instrumentation.reset()
+
+
+def set_instrumentation_callback(callback):
+    """ Call callback(stage, seconds) for every timing recorded (pass
+    None to stop). Note it may be called from loader threads. """
+    _instrumentation.callback = callback
+
+
+
+
+### PIL to wx conversion -------------------------------------------------
+
+# PIL modes that convert losslessly to 8 bit RGB(A) and can therefore be
+# handed to wx.Image in memory. Anything else (16 bit, float...) goes
+# through PIL's PNG encoder instead.
+_WX_DIRECT_MODES = ('1', 'L', 'LA', 'La', 'P', 'PA', 'RGB', 'RGBA',
+                    'RGBa', 'RGBX', 'CMYK', 'YCbCr')
+_ALPHA_MODES = ('LA', 'La', 'PA', 'RGBA', 'RGBa')
+
+
+class _DecodedImage:
+    """ Pixels decoded off the main thread, ready to become a wx.Image.
+
+    wx objects are only created on the main thread, so workers hand over
+    plain byte strings (or, for the PNG fallback, a temp file name).
+    source_size is the full resolution of the image file, which may be
+    larger than the decoded pixels (e.g. for a draft preview).
+    frame_count is more than 1 for animations, of which only the first
+    frame is decoded here (see _AnimationPlayer). regions is set when
+    full resolution detail can be read from the source a tile at a time
+    (see _RegionSource).
+    """
+    def __init__(self, width, height, data=None, alpha=None,
+                 temp_file=None, source_size=None, frame_count=1):
+        self.width = width
+        self.height = height
+        self.data = data
+        self.alpha = alpha
+        self.temp_file = temp_file
+        self.source_size = source_size or (width, height)
+        self.frame_count = frame_count
+        self.regions = None
+
+        # The temp file goes once it has been read, or once this is
+        # dropped unread (e.g. by a cancelled load)
+        self._remove_temp_file = (weakref.finalize(self, _remove_file,
+                                                   temp_file)
+                                  if temp_file is not None else None)
+
+
+    @property
+    def nbytes(self):
+        """ Memory held by the decoded pixels """
+        return len(self.data or b'') + len(self.alpha or b'')
+
+
+    def get_pixel(self, x, y):
+        """ Get the (red, green, blue, alpha) of one pixel. alpha is None
+        if the image has no transparency. Not for temp file images. """
+        index = y * self.width + x
+        red, green, blue = self.data[index * 3:index * 3 + 3]
+        alpha = self.alpha[index] if self.alpha is not None else None
+        return red, green, blue, alpha
+
+
+    def to_wx_image(self):
+        """ Create the wx.Image. Must be called on the main thread. """
+        if self.temp_file is not None:
+            image = wx.Image(self.temp_file)
+            self._remove_temp_file() # Pixels are in memory now
+
+            # Keep them, in case this is converted again (it can be shared
+            # by loads that decoded at the same time, see _decode_once)
+            self.data = bytes(image.GetDataBuffer())
+            if image.HasAlpha():
+                self.alpha = bytes(image.GetAlphaBuffer())
+            self.temp_file = None
+            return image
+        return wx.ImageFromBuffer(self.width, self.height,
+                                  self.data, self.alpha)
+
+
+def _pil_to_buffers(image, source_size=None):
+    """ Decode a PIL image into buffers wx.Image can use directly.
+
+    PIL packs the pixels straight into an RGB byte string (and an alpha
+    byte string if the image has transparency), and wx.ImageFromBuffer
+    then uses those buffers as its pixel storage instead of copying them.
+    """
+    if image.mode == 'P' and 'transparency' in image.info:
+        image = image.convert('RGBA')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.mode in _ALPHA_MODES else 'RGB')
+
+    data = image.tobytes('raw', 'RGB')
+    alpha = image.tobytes('raw', 'A') if image.mode == 'RGBA' else None
+    width, height = image.size
+    return _DecodedImage(width, height, data, alpha,
+                         source_size=source_size)
+
+
+
+
+### HTTP fetching -----------------------------------------------------------
+
+def _get_user_cache_dir():
+    """ Get this user's cache directory for the platform """
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(
+            os.path.join('~', 'AppData', 'Local'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser(os.path.join('~', 'Library', 'Caches'))
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(
+            os.path.join('~', '.cache'))
+    return os.path.join(base, 'image_inspector')
+
+
+# Where downloaded images are cached, and how large that cache may grow.
+# Per user, as the package directory may be read only once installed.
+HTTP_CACHE_DIR = os.path.join(_get_user_cache_dir(), 'http_cache')
+HTTP_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# (connect, read) timeouts in seconds for HTTP requests. Fetches run on the
+# loader pool, so a stalled server would otherwise hold up local decodes.
+HTTP_TIMEOUT = (5, 30)
+
+# Size of the pieces HTTP responses are streamed to disk in
+HTTP_CHUNK_SIZE = 64 * 1024
+
+_http_fetcher = None
+_http_fetcher_lock = threading.Lock()
+
+
+class _HttpFetcher:
+    """ Downloads images over a pooled session into an on-disk cache.
+
+    Bodies are streamed to disk in chunks and stored under the SHA-256 of
+    their content, so two URLs serving the same bytes share one file.
+    index.json in the cache directory maps each URL to its content digest
+    plus the ETag/Last-Modified validators the server sent. Cached URLs
+    are revalidated with a conditional GET, and a 304 is served from disk.
+    Least recently used URLs are evicted once the cached content exceeds
+    max_bytes.
+    """
+    def __init__(self, cache_dir=HTTP_CACHE_DIR,
+                 max_bytes=HTTP_CACHE_MAX_BYTES, session=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.bytes_downloaded = 0
+        self.bytes_from_cache = 0
+        self._session = session
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_file = os.path.join(cache_dir, 'index.json')
+        self._index = self._read_index()
+
+
+    @property
+    def session(self):
+        """ Shared requests.Session, so connections are kept alive """
+        if self._session is None:
+            import requests # Only needed once a URL is opened
+            self._session = requests.Session()
+        return self._session
+
+
+    def _read_index(self):
+        """ Load the URL index, starting afresh if it is missing or bad """
+        try:
+            with open(self._index_file, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+
+    def _write_index(self):
+        """ Save the URL index (call with the lock held) """
+        temp_name = self._index_file + '.part'
+        with open(temp_name, 'w', encoding='utf-8') as file:
+            json.dump(self._index, file)
+        os.replace(temp_name, self._index_file)
+
+
+    def _content_path(self, digest):
+        """ Get the cache file holding the content with the given digest """
+        return os.path.join(self.cache_dir, digest)
+
+
+    def fetch(self, url):
+        """ Return the path of a cached, up to date copy of url """
+        with self._lock:
+            entry = self._index.get(url)
+            if entry and not os.path.exists(self._content_path(entry['digest'])):
+                entry = None
+
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        with self.session.get(url, headers=headers, stream=True,
+                              timeout=HTTP_TIMEOUT) as response:
+            if entry and response.status_code == 304: # Not modified
+                with self._lock:
+                    entry['used'] = time.time()
+                    self.bytes_from_cache += entry['size']
+                    self._write_index()
+                return self._content_path(entry['digest'])
+            if response.status_code != 200:
+                raise Exception(f'Failed to retrieve image file {url}')
+            digest, size = self._stream_to_cache(response)
+
+        with self._lock:
+            self._index[url] = {
+                'digest': digest,
+                'size': size,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'used': time.time(),
+            }
+            self.bytes_downloaded += size
+            self._evict()
+            self._write_index()
+        return self._content_path(digest)
+
+
+    def _stream_to_cache(self, response):
+        """ Write a response body to the cache chunk by chunk, hashing it
+        on the way, and return its (digest, size) """
+        sha = hashlib.sha256()
+        size = 0
+        handle, temp_name = tempfile.mkstemp(dir=self.cache_dir,
+                                             suffix='.part')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                for chunk in response.iter_content(HTTP_CHUNK_SIZE):
+                    sha.update(chunk)
+                    file.write(chunk)
+                    size += len(chunk)
+            digest = sha.hexdigest()
+            os.replace(temp_name, self._content_path(digest))
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+        return digest, size
+
+
+    def _cached_bytes(self):
+        """ Total size of distinct cached content """
+        sizes = {entry['digest']: entry['size']
+                 for entry in self._index.values()}
+        return sum(sizes.values())
+
+
+    def _evict(self):
+        """ Drop least recently used URLs until the cache fits (call with
+        the lock held). Content files are removed once no URL uses them. """
+        by_age = sorted(self._index, key=lambda url: self._index[url]['used'])
+        while self._cached_bytes() > self.max_bytes and len(by_age) > 1:
+            digest = self._index.pop(by_age.pop(0))['digest']
+            if all(e['digest'] != digest for e in self._index.values()):
+                try:
+                    os.remove(self._content_path(digest))
+                except OSError:
+                    pass
+
+
+    def clear(self):
+        """ Remove every cached download """
+        with self._lock:
+            for digest in {entry['digest'] for entry in self._index.values()}:
+                try:
+                    os.remove(self._content_path(digest))
+                except OSError:
+                    pass
+            self._index = {}
+            self._write_index()
+
+
+    def stats(self):
+        """ Return download/cache byte counters as a dict """
+        with self._lock:
+            return {'bytes_downloaded': self.bytes_downloaded,
+                    'bytes_from_cache': self.bytes_from_cache,
+                    'cached_urls': len(self._index),
+                    'cached_bytes': self._cached_bytes()}
+
+
+def _get_http_fetcher():
+    """ Get the shared HTTP fetcher, creating it on first use """
+    global _http_fetcher
+    with _http_fetcher_lock: # Loader threads may ask at the same time
+        if _http_fetcher is None:
+            _http_fetcher = _HttpFetcher()
+    return _http_fetcher
+
+
+def http_cache_stats():
+    """ Report bytes downloaded and bytes served from the HTTP cache """
+    return _get_http_fetcher().stats()
+
+
+def clear_http_cache():
+    """ Empty the on-disk HTTP cache """
+    _get_http_fetcher().clear()
+
+
+
+
+### Background loading -----------------------------------------------------
+
+# Worker threads shared by every ImageInspector for fetching and decoding
+LOADER_THREADS = 4
+
+# Images with fewer pixels than this are decoded without a preview stage
+PREVIEW_MIN_PIXELS = 2 * 1024 * 1024
+
+_loader_pool = None
+
+
+def _get_loader_pool():
+    """ Get the shared loader thread pool, creating it on first use """
+    global _loader_pool
+    if _loader_pool is None:
+        _loader_pool = ThreadPoolExecutor(max_workers=LOADER_THREADS,
+                                          thread_name_prefix='image_inspector')
+    return _loader_pool
+
+
+# Decodes in progress, by image cache key (see _decode_once)
+_decoding = {}
+_decoding_lock = threading.Lock()
+
+
+def _decode_once(key, decode):
+    """ Run decode() for the image cache key, unless another thread is
+    already decoding it, in which case wait for and share its result.
+    Panels opening the same image at the same time (e.g. in a comparison
+    layout) then decode it once, and the image cache gives them the same
+    _SharedImage. """
+    with _decoding_lock:
+        future = _decoding.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = _decoding[key] = Future()
+    if not is_owner:
+        return future.result()
+    try:
+        decoded = decode()
+        future.set_result(decoded)
+        return decoded
+    except BaseException as error:
+        future.set_exception(error)
+        raise
+    finally:
+        with _decoding_lock:
+            del _decoding[key]
+
+
+def _make_temp_png(image_file):
+    """ Create an empty temp PNG file named after image_file and return
+    its name. Each decode gets a file of its own, as decodes of the same
+    image under different keys (e.g. for two panel sizes) can run at the
+    same time. """
+    stem = os.path.splitext(os.path.basename(image_file))[0]
+    handle, filename = tempfile.mkstemp(prefix=f'{stem}_', suffix='.png')
+    os.close(handle)
+    return filename
+
+
+def _remove_file(filename):
+    """ Delete filename if it is still there """
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def _retrieve_image_from_web(image_file):
+    """ Download image file from internet into the HTTP cache """
+    return _get_http_fetcher().fetch(image_file)
+
+
+def _read_image_source(image_file):
+    """ Get something PILImage.open can read image_file from """
+    if image_file.startswith('http'):
+        return _retrieve_image_from_web(image_file)
+    return image_file
+
+
+def _get_source_version(image_file, source):
+    """ Get a value that changes whenever the image at image_file does.
+    Downloads are named after their content hash in the HTTP cache, so
+    that name is used for URLs. Local files use mtime and size. """
+    if image_file.startswith('http'):
+        return os.path.basename(source)
+    stat = os.stat(source)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _open_pil_image(source):
+    """ Open (but do not decode) a PIL image from a path or byte stream """
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    from PIL import Image as PILImage # Imported on first decode
+    return PILImage.open(source)
+
+
+def _decode_preview(source, decode_size):
+    """ Quickly decode a low resolution preview of a JPEG.
+    draft() makes the JPEG decoder skip straight to 1/8 scale DCT output,
+    which is several times faster than a full decode. Returns None for
+    other formats, for images too small to be worth previewing, and when
+    the decode at decode_size will be no bigger than the preview anyway.
+    """
+    image = _open_pil_image(source)
+    width, height = image.size
+    if image.format != 'JPEG' or width * height < PREVIEW_MIN_PIXELS:
+        return None
+    preview_size = (width // 8, height // 8)
+    if decode_size is not None and (decode_size[0] <= preview_size[0] and
+                                    decode_size[1] <= preview_size[1]):
+        return None
+    image.draft('RGB', preview_size)
+    return _pil_to_buffers(image, source_size=(width, height))
+
+
+def _get_decode_size(image_size, panel_size):
+    """ Get the smallest size an image needs decoding at to fill its fit
+    to panel size pixel for pixel """
+    fit_width, fit_height = fit_size(image_size, panel_size)
+    return (max(1, int(math.ceil(fit_width))),
+            max(1, int(math.ceil(fit_height))))
+
+
+def _decode_reduced(source, image_file, panel_size):
+    """ Decode the image at the lowest resolution that still covers
+    panel_size once fitted to it.
+
+    JPEGs use draft(), which scales during the DCT by 1/2, 1/4 or 1/8 and
+    so never holds the full image in memory. Other formats are decoded in
+    full and then shrunk with reduce(), so at least only the reduced copy
+    is kept. Returns the full image if no reduction is possible.
+    """
+    image = _open_pil_image(source)
+    source_size = image.size
+    frame_count = getattr(image, 'n_frames', 1) # Lost by reduce()
+    if image.mode not in _WX_DIRECT_MODES:
+        return _decode_full(source, image_file)
+    decode_size = _get_decode_size(source_size, panel_size)
+
+    if image.format == 'JPEG':
+        image.draft('RGB', decode_size)
+    else:
+        factor = min(source_size[0] // decode_size[0],
+                     source_size[1] // decode_size[1])
+        if factor > 1:
+            try:
+                image = image.reduce(factor)
+            except ValueError: # Mode without a reduce implementation
+                pass
+    decoded = _pil_to_buffers(image, source_size=source_size)
+    decoded.frame_count = frame_count
+    return decoded
+
+
+def _decode_full(source, image_file):
+    """ Decode the full resolution image """
+    image = _open_pil_image(source)
+    frame_count = getattr(image, 'n_frames', 1)
+    if image.mode in _WX_DIRECT_MODES:
+        decoded = _pil_to_buffers(image)
+        decoded.frame_count = frame_count
+        return decoded
+
+    # Fallback for modes wx.Image can't take directly: round trip the
+    # image through a temp PNG file and let wx decode that
+    filename = _make_temp_png(image_file)
+    try:
+        image.save(filename, 'PNG')
+    except BaseException:
+        _remove_file(filename)
+        raise
+    return _DecodedImage(image.width, image.height, temp_file=filename,
+                         frame_count=frame_count)
+
+
+class _LoadJob:
+    """ Loads one image file on the shared loader pool.
+
+    Results are passed back to the main thread with wx.CallAfter: first
+    on_preview with a quick low resolution decode (if the format has
+    one), then on_loaded with the image, or on_failed with the
+    exception. If panel_size is given, on_loaded gets the image decoded
+    at just enough resolution to fill a panel of that size, otherwise it
+    gets the full resolution image. Once cancel() has been called no
+    further callbacks are made, even for results that were already on
+    their way.
+    """
+    def __init__(self, image_file, on_preview, on_loaded, on_failed,
+                 panel_size=None):
+        self.image_file = image_file
+        self.panel_size = panel_size
+        self.on_preview = on_preview
+        self.on_loaded = on_loaded
+        self.on_failed = on_failed
+        self.cancelled = threading.Event()
+        self.future = None
+
+
+    def start(self):
+        """ Queue the job on the loader pool """
+        self.future = _get_loader_pool().submit(self._run)
+        return self
+
+
+    def cancel(self):
+        """ Stop the job at its next stage and suppress its callbacks """
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+
+    def _run(self):
+        """ Fetch, preview and decode (runs on a worker thread) """
+        try:
+            with _timed('load.fetch'):
+                source = _read_image_source(self.image_file)
+            if self.cancelled.is_set():
+                return
+
+            # Another panel may already have decoded this version
+            version = _get_source_version(self.image_file, source)
+            full_key = (self.image_file, version, 'full')
+            decode_size = reduced_key = None
+            if self.panel_size is not None:
+                image_size = _open_pil_image(source).size
+                decode_size = _get_decode_size(image_size, self.panel_size)
+                reduced_key = (self.image_file, version, decode_size)
+            shared = _image_cache.lookup(full_key)
+            if shared is None and reduced_key is not None:
+                shared = _image_cache.lookup_covering(reduced_key)
+            if shared is not None:
+                wx.CallAfter(self._deliver, self.on_loaded, shared)
+                return
+
+            # A batch() preview that is large enough replaces the decode
+            stored = None
+            if _preview_cache is not None and decode_size is not None:
+                stored = _preview_cache.load(self.image_file, version,
+                                             decode_size, image_size)
+            if stored is not None:
+                decoded, covers = stored
+                if covers:
+                    decoded.regions = _open_region_source(source)
+                    wx.CallAfter(self._deliver, self.on_loaded, decoded,
+                                 reduced_key)
+                    return
+                if self.on_preview is not None:
+                    wx.CallAfter(self._deliver, self.on_preview, decoded)
+            elif self.on_preview is not None:
+                preview = _decode_preview(source, decode_size)
+                if preview is not None:
+                    wx.CallAfter(self._deliver, self.on_preview, preview)
+            if self.cancelled.is_set():
+                return
+            with _timed('load.decode'):
+                decoded = _decode_once(
+                    reduced_key or full_key,
+                    lambda: self._decode(source, decode_size))
+            is_full = decoded.width == decoded.source_size[0]
+            key = full_key if is_full else reduced_key
+            wx.CallAfter(self._deliver, self.on_loaded, decoded, key)
+        except Exception as error:
+            wx.CallAfter(self._deliver, self.on_failed, error)
+
+
+    def _decode(self, source, decode_size):
+        """ Decode at the resolution asked for, from a region source if
+        the image has one """
+        regions = None
+        if self.panel_size is not None:
+            regions = _open_region_source(source)
+        if regions is not None:
+            decoded = regions.decode_reduced(decode_size)
+        elif self.panel_size is not None:
+            decoded = _decode_reduced(source, self.image_file,
+                                      self.panel_size)
+        else:
+            decoded = _decode_full(source, self.image_file)
+        decoded.regions = regions
+        return decoded
+
+
+    def _deliver(self, callback, result, key=None):
+        """ Pass a result on unless the job was cancelled meanwhile.
+        Decoded pixels are turned into a _SharedImage here, on the main
+        thread, and added to the image cache if they have a key. """
+        if self.cancelled.is_set():
+            return
+        if isinstance(result, _DecodedImage):
+            with _timed('load.convert'):
+                result = _image_cache.add(key, result)
+        callback(result)
+
+
+
+
+### Region-on-demand sources ----------------------------------------------
+
+# Images with at least this many pixels are read a region at a time, where
+# their format allows, instead of being decoded whole
+REGION_MIN_PIXELS = 32 * 1024 * 1024
+
+# Upper bound on memory held by one source's decoded full resolution tiles
+REGION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Upper bound on the size of each band of rows read while building the
+# reduced image of a region source
+REGION_BAND_MAX_BYTES = 32 * 1024 * 1024
+
+# Uncompressed pixel layouts that can be read straight from a memory map,
+# with their bytes per pixel
+_MEMMAP_RAWMODES = {'L': 1, 'RGB': 3, 'BGR': 3, 'RGBA': 4}
+
+
+class _MemmapReader:
+    """ Reads regions of an uncompressed single block image (e.g. PPM,
+    BMP, single strip TIFF) from a read only memory map of the file.
+    Only the pages a region covers are ever read in, and the OS can drop
+    them again under memory pressure. """
+    def __init__(self, path, offset, size, rawmode, stride, orientation):
+        import numpy as np
+        self.size = size
+        self.rawmode = rawmode
+        self.bands = _MEMMAP_RAWMODES[rawmode]
+        self.orientation = orientation
+        self.data = np.memmap(path, dtype=np.uint8, mode='r', offset=offset,
+                              shape=(size[1], stride))
+
+
+    def read(self, box):
+        """ Return the PIL image of box, as (left, top, right, bottom) """
+        import numpy as np
+        from PIL import Image as PILImage
+        left, top, right, bottom = box
+        if self.orientation < 0: # Rows stored bottom up
+            height = self.size[1]
+            rows = self.data[height - bottom:height - top][::-1]
+        else:
+            rows = self.data[top:bottom]
+        pixels = rows[:, left * self.bands:right * self.bands]
+        pixels = pixels.reshape(bottom - top, right - left, self.bands)
+        if self.rawmode == 'BGR':
+            pixels = pixels[..., ::-1]
+        if self.bands == 1:
+            pixels = pixels[..., 0]
+        return PILImage.fromarray(np.ascontiguousarray(pixels))
+
+
+class _TileListReader:
+    """ Reads regions of an image stored as many separately decodable
+    tiles or strips (e.g. tiled and multi strip TIFFs).
+
+    PIL decodes an image by running through its tile list into one
+    buffer the size of the image. Here the list is cut down to the tiles
+    overlapping the region, shifted, and decoded into a buffer just big
+    enough for them, so only those tiles are read and held.
+    """
+    def __init__(self, source):
+        self.source = source
+
+
+    def read(self, box):
+        """ Return the PIL image of box, as (left, top, right, bottom) """
+        image = _open_pil_image(self.source)
+        tiles = [tile for tile in image.tile
+                 if tile[1][0] < box[2] and tile[1][2] > box[0]
+                 and tile[1][1] < box[3] and tile[1][3] > box[1]]
+        left = min(tile[1][0] for tile in tiles)
+        top = min(tile[1][1] for tile in tiles)
+        right = max(tile[1][2] for tile in tiles)
+        bottom = max(tile[1][3] for tile in tiles)
+
+        # Relies on PIL internals: _size is what load() sizes its buffer by
+        image._size = (right - left, bottom - top)
+        image.tile = [(name, (x0 - left, y0 - top, x1 - left, y1 - top),
+                       offset, args)
+                      for name, (x0, y0, x1, y1), offset, args
+                      in (tile[:4] for tile in tiles)]
+        image.load()
+        return image.crop((box[0] - left, box[1] - top,
+                           box[2] - left, box[3] - top))
+
+
+def _open_region_source(source):
+    """ Get a _RegionSource for source if it is large and its format can
+    be read a region at a time, or None """
+    if not isinstance(source, str): # Only files can be reopened or mapped
+        return None
+    try:
+        image = _open_pil_image(source)
+    except Exception:
+        return None
+    width, height = image.size
+    if (width * height < REGION_MIN_PIXELS
+            or getattr(image, 'n_frames', 1) > 1
+            or image.mode not in _WX_DIRECT_MODES or not image.tile):
+        return None
+
+    if len(image.tile) > 1:
+        if any(tile[0] == 'libtiff' for tile in image.tile):
+            return None # Decoded by libtiff in one go
+        return _RegionSource(_TileListReader(source), image.size)
+
+    name, extents, offset, args = image.tile[0][:4]
+    if isinstance(args, str):
+        args = (args,)
+    rawmode = args[0]
+    if (name != 'raw' or rawmode not in _MEMMAP_RAWMODES
+            or tuple(extents) != (0, 0, width, height)):
+        return None
+    stride = (args[1] if len(args) > 1 else 0) or width * _MEMMAP_RAWMODES[rawmode]
+    orientation = args[2] if len(args) > 2 else 1
+    try:
+        reader = _MemmapReader(source, offset, image.size, rawmode, stride,
+                               orientation)
+    except (OSError, ValueError): # e.g. file shorter than it claims
+        return None
+    return _RegionSource(reader, image.size)
+
+
+class _RegionSource:
+    """ Pixels of a large image, read a tile at a time at full resolution
+    or at any level of a pyramid like _ImagePyramid's above it.
+
+    Lets a panel show an image this size without ever decoding all of
+    it: the reduced image is built a band of rows at a time, and tiles of
+    the TILE_SIZE grid of the level being shown are read from the file
+    in the background as the view zooms in on them. A level n tile is
+    read at full resolution and reduced by 2**n, so only levels with more
+    detail than the reduced image are ever read. The tiles wanted in one
+    row are read as one box, so strips that span the whole width are
+    decoded once per row rather than once per tile. Tiles read are kept
+    as decoded buffers, least recently used first out once they take up
+    more than max_bytes, so memory is bounded by the view and this cache
+    rather than by the image.
+    """
+    def __init__(self, reader, size, max_bytes=REGION_CACHE_MAX_BYTES):
+        self.reader = reader
+        self.size = size
+        self.max_level = int(math.log2(max(1, min(size))))
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._tiles = OrderedDict() # (level, col, row) -> _DecodedImage
+        self._pending = {} # (level, col, row) -> callbacks waiting for it
+        self._failed = set() # (level, col, row) that could not be read
+        self._lock = threading.Lock()
+
+
+    def get_level_size(self, level):
+        """ Get the size of level, halved and rounded down per level like
+        _ImagePyramid """
+        return (max(1, self.size[0] >> level), max(1, self.size[1] >> level))
+
+
+    def _read_box(self, box):
+        """ Read box as a PIL image in a mode reduce() and wx can take """
+        image = self.reader.read(box)
+        if image.mode == 'P' and 'transparency' in image.info:
+            image = image.convert('RGBA')
+        elif image.mode not in ('L', 'RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in _ALPHA_MODES
+                                  else 'RGB')
+        return image
+
+
+    def _read_reduced(self, box, factor):
+        """ Read box shrunk by factor. Works through bands of rows,
+        reducing each one as it goes, so at most one band is held at full
+        resolution (strips may be decoded full width, so bands are sized
+        by the width of the image rather than of box). """
+        from PIL import Image as PILImage
+        left, top, right, bottom = box
+        band_height = REGION_BAND_MAX_BYTES // (self.size[0] * 4) // factor * factor
+        band_height = max(factor, band_height)
+
+        reduced = None
+        for band_top in range(top, bottom, band_height):
+            band = self._read_box((left, band_top, right,
+                                   min(bottom, band_top + band_height)))
+            if factor > 1:
+                band = band.reduce(factor)
+            if reduced is None:
+                reduced = PILImage.new(band.mode, (-(-(right - left) // factor),
+                                                   -(-(bottom - top) // factor)))
+            reduced.paste(band, (0, (band_top - top) // factor))
+        return reduced
+
+
+    def get_tile(self, level, col, row):
+        """ Return the tile at (col, row) of the TILE_SIZE grid of level as
+        a _DecodedImage, or None if it has not been read (see
+        request_tiles) """
+        key = (level, col, row)
+        with self._lock:
+            decoded = self._tiles.get(key)
+            if decoded is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+            return decoded
+
+
+    def request_tiles(self, level, tiles, on_read):
+        """ Read tiles, a list of (col, row), of level on the loader pool,
+        then call on_read() on the main thread. Tiles already being read
+        are not read again, and tiles that failed are not retried. """
+        rows = {}
+        with self._lock:
+            for col, row in tiles:
+                key = (level, col, row)
+                if key in self._tiles or key in self._failed:
+                    continue
+                waiting = self._pending.get(key)
+                if waiting is None:
+                    self._pending[key] = waiting = []
+                    rows.setdefault(row, []).append(col)
+                    self.misses += 1
+                if on_read not in waiting:
+                    waiting.append(on_read)
+        for row, cols in rows.items():
+            _get_loader_pool().submit(self._read_row, level, row, cols)
+
+
+    def _read_row(self, level, row, cols):
+        """ Read tiles cols of row of level as one box and split it into
+        tiles. Runs on the loader pool. """
+        level_width, level_height = self.get_level_size(level)
+        left = min(cols) * TILE_SIZE
+        top = row * TILE_SIZE
+        right = min((max(cols) + 1) * TILE_SIZE, level_width)
+        bottom = min(top + TILE_SIZE, level_height)
+        factor = 2 ** level
+
+        tiles = {}
+        try:
+            with _timed('load.region'):
+                image = self._read_reduced((left * factor, top * factor,
+                                            right * factor, bottom * factor),
+                                           factor)
+            for col in cols:
+                x = col * TILE_SIZE - left
+                tiles[col] = _pil_to_buffers(image.crop(
+                    (x, 0, min(x + TILE_SIZE, image.width), image.height)))
+        except Exception as error:
+            _log.warning('Failed to read level %d row %d of a region '
+                         'source: %s', level, row, error)
+
+        callbacks = []
+        with self._lock:
+            for col in cols:
+                key = (level, col, row)
+                for on_read in self._pending.pop(key, ()):
+                    if on_read not in callbacks:
+                        callbacks.append(on_read)
+                if col not in tiles:
+                    self._failed.add(key)
+                elif key not in self._tiles:
+                    self._tiles[key] = tiles[col]
+                    self.nbytes += tiles[col].nbytes
+            while self.nbytes > self.max_bytes and len(self._tiles) > 1:
+                _, evicted = self._tiles.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+        if tiles:
+            for on_read in callbacks:
+                wx.CallAfter(on_read)
+
+
+    def decode_reduced(self, decode_size):
+        """ Decode the whole image shrunk to no less than decode_size """
+        width, height = self.size
+        factor = max(1, min(width // decode_size[0], height // decode_size[1]))
+        return _pil_to_buffers(self._read_reduced((0, 0, width, height),
+                                                  factor),
+                               source_size=self.size)
+
+
+    def clear(self):
+        """ Drop every cached tile """
+        with self._lock:
+            self._tiles.clear()
+            self.nbytes = 0
+
+
+
+
+### Render cache ---------------------------------------------------------
+
+class _RenderCache:
+    """ LRU cache of device bitmaps kept alive between paints.
+
+    Converting a wx.Image to a wx.Bitmap and then to a GraphicsBitmap
+    touches every pixel it covers, so it should only happen for tiles that
+    have never been drawn before. Panning over tiles already on screen
+    should be all hits. Entries are evicted oldest first once their total
+    size goes over max_bytes.
+    """
+    def __init__(self, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (bitmap, nbytes), oldest first
+
+
+    def get(self, key, factory):
+        """ Return the cached bitmap for key, building it on a miss.
+        factory must return a (bitmap, nbytes) tuple.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        bitmap, nbytes = factory()
+        self._entries[key] = (bitmap, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_nbytes
+        return bitmap
+
+
+    def __contains__(self, key):
+        """ Whether key has a bitmap cached, without counting a hit """
+        return key in self._entries
+
+
+    def clear(self):
+        """ Drop every cached bitmap (counters are kept) """
+        self._entries.clear()
+        self.nbytes = 0
+
+
+    def stats(self):
+        """ Return hit/miss counters and current size as a dict """
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self._entries), 'nbytes': self.nbytes}
+
+
+
+
+### Image pyramid ----------------------------------------------------------
+
+def _image_nbytes(image):
+    """ Approximate memory held by a wx.Image's pixel data """
+    channels = 4 if image.HasAlpha() else 3
+    return image.GetWidth() * image.GetHeight() * channels
+
+
+class _ImagePyramid:
+    """ Lazily built mipmap levels of a wx.Image.
+
+    Level 0 is the image itself and each level above it is half the width
+    and height of the one below. Levels are only built when first asked
+    for, each from the nearest finer level already in memory, so zooming
+    out step by step never rescales the full image more than once.
+    Downsampled levels are kept in LRU order and dropped once they take
+    up more than max_bytes.
+    """
+    def __init__(self, image, max_bytes=PYRAMID_MAX_BYTES):
+        self.base = image
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._levels = OrderedDict() # level -> wx.Image, oldest first
+
+        # Smallest level is the one where either side reaches 1 pixel
+        smallest_side = max(1, min(image.GetWidth(), image.GetHeight()))
+        self.max_level = int(math.log2(smallest_side))
+
+
+    def get_level(self, level):
+        """ Return the wx.Image for level, building it if required """
+        level = max(0, min(level, self.max_level))
+        if level == 0:
+            return self.base
+        if level in self._levels:
+            self._levels.move_to_end(level)
+            return self._levels[level]
+
+        # Start from the nearest finer level that is already built
+        finer = [l for l in self._levels if l < level]
+        start = max(finer) if finer else 0
+        image = self.get_level(start) if start else self.base
+        for current in range(start + 1, level + 1):
+            image = image.Scale(max(1, image.GetWidth() // 2),
+                                max(1, image.GetHeight() // 2),
+                                wx.IMAGE_QUALITY_BOX_AVERAGE)
+            self._store(current, image)
+        return image
+
+
+    def _store(self, level, image):
+        """ Keep a built level, evicting old levels to stay under the cap """
+        self._levels[level] = image
+        self.nbytes += _image_nbytes(image)
+        while self.nbytes > self.max_bytes and len(self._levels) > 1:
+            _, evicted = self._levels.popitem(last=False)
+            self.nbytes -= _image_nbytes(evicted)
+
+
+    def clear(self):
+        """ Drop every downsampled level """
+        self._levels.clear()
+        self.nbytes = 0
+
+
+
+
+### Repaint scheduling ----------------------------------------------------
+
+class _RepaintScheduler:
+    """ Coalesces repaint requests into at most one paint per frame.
+
+    Mice and touch screens can send events far faster than the display
+    refreshes. Rather than calling Refresh() for every event, handlers
+    call request(). The first request in a frame interval repaints right
+    away (if the previous paint was long enough ago) or arms a one shot
+    timer for the start of the next interval; further requests until
+    then are merged into that paint. The paint itself reads the view
+    state when it happens, so it always shows the latest pan and zoom.
+
+    Linked panels (see _ViewerPanel's link_to) are added to windows and
+    share one scheduler, so a drag in any of them repaints them all in
+    the same pass.
+    """
+    def __init__(self, window, fps=TARGET_FPS):
+        self.window = window
+        self.windows = [window] # Everything repainted by each render
+        self.requests = 0
+        self.renders = 0
+        self.set_fps(fps)
+        self._pending = False
+        self._last_render = 0
+        self._timer = wx.Timer(window)
+        window.Bind(wx.EVT_TIMER, self._on_timer, self._timer)
+
+
+    def set_fps(self, fps):
+        """ Change the target frame rate """
+        self.fps = fps
+        self.interval = 1 / fps
+
+
+    def request(self):
+        """ Ask for a repaint at the next frame """
+        self.requests += 1
+        if self._pending:
+            return
+        self._pending = True
+        wait = self._last_render + self.interval - time.perf_counter()
+        if wait <= 0:
+            self._render()
+        else:
+            self._timer.StartOnce(max(1, int(wait * 1000)))
+
+
+    def _on_timer(self, event):
+        """ Frame interval elapsed with a repaint pending """
+        if self._pending:
+            self._render()
+
+
+    def _render(self):
+        """ Issue the coalesced repaint """
+        self._pending = False
+        self._last_render = time.perf_counter()
+        self.renders += 1
+        for window in self.windows:
+            window.Refresh()
+
+
+    def add_window(self, window):
+        """ Repaint window along with the others from now on """
+        self.windows.append(window)
+
+
+    def remove_window(self, window):
+        """ Stop repainting window """
+        if window in self.windows:
+            self.windows.remove(window)
+
+
+    def stop(self):
+        """ Cancel any pending repaint """
+        self._timer.Stop()
+        self._pending = False
+
+
+    def stats(self):
+        """ Return request/render counters as a dict. merged is the number
+        of requests that were folded into another request's paint. """
+        return {'requests': self.requests, 'renders': self.renders,
+                'merged': self.requests - self.renders, 'fps': self.fps}
+
+
+
+
+### Shared decoded-image cache ---------------------------------------------
+
+# Upper bound on memory held by decoded images no panel is showing
+IMAGE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class _SharedImage:
+    """ A decoded image plus everything derived from it.
+
+    Panels showing the same version of the same source at the same
+    resolution share one of these, so the pixels, pyramid levels and
+    tile bitmaps exist only once. refs counts the panels using it.
+    For animations this is the first frame only.
+    """
+    def __init__(self, key, image, source_size, frame_count=1, regions=None):
+        self.key = key
+        self.image = image
+        self.source_size = source_size
+        self.frame_count = frame_count
+        self.regions = regions # _RegionSource, for very large images
+        self.pyramid = _ImagePyramid(image)
+        self.render_cache = _RenderCache()
+        self.refs = 0
+
+
+    @property
+    def nbytes(self):
+        """ Memory held by the image and everything derived from it """
+        regions_nbytes = self.regions.nbytes if self.regions else 0
+        return (_image_nbytes(self.image) + self.pyramid.nbytes
+                + self.render_cache.nbytes + regions_nbytes)
+
+
+class _ImageCache:
+    """ Process-wide cache of _SharedImages.
+
+    Keyed by (source path or URL, version, resolution), where version
+    changes whenever the file does (see _get_source_version) and
+    resolution is 'full' or the reduced decode size. Images still used by
+    a panel are never evicted; the rest are dropped least recently used
+    first once the total size goes over max_bytes.
+
+    Lookups may come from loader threads. Adding and releasing images
+    happens on the main thread, since it creates and frees wx objects.
+    """
+    def __init__(self, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> _SharedImage, oldest first
+        self._lock = threading.Lock()
+
+
+    def lookup(self, key):
+        """ Return the cached image for key, or None """
+        with self._lock:
+            shared = self._entries.get(key)
+            if shared is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return shared
+
+
+    def lookup_covering(self, key):
+        """ Return the smallest cached image of the same source and version
+        as the reduced key whose resolution is at least key's, or None.
+        Reduced sizes follow the panel size, so this lets a panel share
+        images decoded for another size (e.g. prefetched before a resize).
+        """
+        source, version, (width, height) = key
+        with self._lock:
+            covering = [other for other in self._entries
+                        if other[:2] == (source, version)
+                        and other[2] != 'full'
+                        and other[2][0] >= width and other[2][1] >= height]
+            if not covering:
+                self.misses += 1
+                return None
+            other = min(covering, key=lambda other: other[2][0] * other[2][1])
+            self._entries.move_to_end(other)
+            self.hits += 1
+            return self._entries[other]
+
+
+    def add(self, key, decoded):
+        """ Wrap decoded pixels in a _SharedImage and cache it under key.
+        Images with no key (e.g. previews) are returned uncached. """
+        with self._lock:
+            if key in self._entries: # Decoded twice at the same time
+                return self._entries[key]
+        shared = _SharedImage(key, decoded.to_wx_image(),
+                              decoded.source_size, decoded.frame_count,
+                              decoded.regions)
+        if key is not None:
+            with self._lock:
+                self._entries[key] = shared
+                self._evict()
+        return shared
+
+
+    def acquire(self, shared):
+        """ Note that a panel has started using shared """
+        shared.refs += 1
+
+
+    def release(self, shared):
+        """ Note that a panel has stopped using shared """
+        shared.refs -= 1
+        with self._lock:
+            self._evict()
+
+
+    def _evict(self):
+        """ Drop unused images until under budget (call with lock held) """
+        total = sum(shared.nbytes for shared in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            shared = self._entries[key]
+            if shared.refs <= 0:
+                total -= shared.nbytes
+                del self._entries[key]
+
+
+    def set_max_bytes(self, max_bytes):
+        """ Change the budget, evicting straight away if now over it """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+
+    def clear(self):
+        """ Drop every image no panel is using """
+        with self._lock:
+            for key in [key for key, shared in self._entries.items()
+                        if shared.refs <= 0]:
+                del self._entries[key]
+
+
+    def stats(self):
+        """ Return counters plus a summary of each cached image """
+        with self._lock:
+            entries = [{'source': key[0], 'resolution': key[2],
+                        'size': (shared.image.GetWidth(),
+                                 shared.image.GetHeight()),
+                        'refs': shared.refs, 'nbytes': shared.nbytes}
+                       for key, shared in self._entries.items()]
+        return {'hits': self.hits, 'misses': self.misses,
+                'max_bytes': self.max_bytes,
+                'nbytes': sum(entry['nbytes'] for entry in entries),
+                'entries': entries}
+
+
+_image_cache = _ImageCache()
+
+
+def image_cache_stats():
+    """ Report what the shared decoded-image cache holds """
+    return _image_cache.stats()
+
+
+def clear_image_cache():
+    """ Drop every cached image that no ImageInspector is showing """
+    _image_cache.clear()
+
+
+def set_image_cache_budget(max_bytes):
+    """ Change how much memory cached images may use """
+    _image_cache.set_max_bytes(max_bytes)
+
+
+
+
+### Sequence navigation ---------------------------------------------------
+
+# File extensions picked up when ImageInspector is given a directory
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.jpeg', '.jpg', '.png', '.tif',
+                    '.tiff', '.webp')
+
+# How many images either side of the current one are decoded ahead, and
+# how much memory those decoded neighbours may hold on to
+PREFETCH_RADIUS = 2
+PREFETCH_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _expand_image_files(image_file):
+    """ Turn a path, URL, list, directory or glob pattern into a list of
+    image files """
+    if isinstance(image_file, (list, tuple)):
+        return list(image_file)
+    if image_file.startswith('http'):
+        return [image_file]
+    if os.path.isdir(image_file):
+        return sorted(os.path.join(image_file, name)
+                      for name in os.listdir(image_file)
+                      if name.lower().endswith(IMAGE_EXTENSIONS))
+    if os.path.exists(image_file): # Names like scan[1].png are not patterns
+        return [image_file]
+    if glob.has_magic(image_file):
+        return sorted(glob.glob(image_file))
+    return [image_file]
+
+
+class _Prefetcher:
+    """ Decodes the images around the current one ahead of time.
+
+    Neighbours are loaded nearest first on the shared loader pool and
+    land in the shared image cache, so stepping to one of them is just a
+    cache hit. Up to max_bytes of them are also held (reference counted)
+    so that the cache cannot evict them before they are needed. Moving
+    cancels loads and releases images that have left the window.
+    """
+    def __init__(self, image_files, radius=PREFETCH_RADIUS,
+                 max_bytes=PREFETCH_MAX_BYTES):
+        self.image_files = image_files
+        self.radius = radius
+        self.max_bytes = max_bytes
+        self._jobs = {} # image file -> _LoadJob
+        self._held = {} # image file -> _SharedImage
+
+
+    def update(self, index, panel_size):
+        """ Prefetch around index, for panels of the given size """
+        wanted = []
+        for distance in range(1, self.radius + 1):
+            for neighbour in (index + distance, index - distance):
+                if 0 <= neighbour < len(self.image_files):
+                    wanted.append(self.image_files[neighbour])
+
+        for image_file in list(self._jobs):
+            if image_file not in wanted:
+                self._jobs.pop(image_file).cancel()
+        for image_file in list(self._held):
+            if image_file not in wanted:
+                _image_cache.release(self._held.pop(image_file))
+
+        for image_file in wanted:
+            if image_file in self._jobs or image_file in self._held:
+                continue
+            self._jobs[image_file] = _LoadJob(
+                image_file, on_preview=None,
+                on_loaded=lambda shared, f=image_file: self._on_loaded(f, shared),
+                on_failed=lambda error, f=image_file: self._jobs.pop(f, None),
+                panel_size=panel_size).start()
+
+
+    def _on_loaded(self, image_file, shared):
+        """ Hold a prefetched image if it fits in the budget """
+        self._jobs.pop(image_file, None)
+        held_bytes = sum(held.nbytes for held in self._held.values())
+        if held_bytes + shared.nbytes <= self.max_bytes:
+            _image_cache.acquire(shared)
+            self._held[image_file] = shared
+
+
+    def cancel(self):
+        """ Stop all prefetching and release everything held """
+        for job in self._jobs.values():
+            job.cancel()
+        self._jobs.clear()
+        for shared in self._held.values():
+            _image_cache.release(shared)
+        self._held.clear()
+
+
+
+
+### Batch previews ---------------------------------------------------------
+
+# Box batch previews are fitted to by default (the size view() opens at)
+BATCH_BOX_SIZE = (400, 300)
+
+# Manifest batch() writes next to its previews
+PREVIEW_MANIFEST = 'index.json'
+
+_preview_cache = None
+
+
+def _walk_image_files(source_dir, exclude=None):
+    """ Get every image file under source_dir, in a stable order, skipping
+    the folder exclude (e.g. previews written inside the source folder) """
+    image_files = []
+    for folder, folders, names in os.walk(source_dir):
+        folders[:] = sorted(name for name in folders
+                            if os.path.join(folder, name) != exclude)
+        image_files.extend(os.path.join(folder, name) for name in sorted(names)
+                           if name.lower().endswith(IMAGE_EXTENSIONS))
+    return image_files
+
+
+def _get_preview_targets(source_size, sizes, levels):
+    """ Get (name, size) of each preview to write for an image.
+    Fitted previews use the viewer's fit logic, so they are exactly what
+    a panel of that size would decode. Levels are the viewer's pyramid
+    levels above the full image (each half the size of the last). """
+    targets = [('fit%dx%d' % tuple(box), _get_decode_size(source_size, box))
+               for box in sizes]
+    for level in range(1, levels + 1):
+        targets.append(('level%d' % level,
+                        (max(1, source_size[0] >> level),
+                         max(1, source_size[1] >> level))))
+    return targets
+
+
+def _write_previews(source, output_base, output_dir, sizes, levels):
+    """ Write the previews of one image (runs in a worker process).
+    Returns its manifest entry. """
+    from PIL import Image as PILImage
+    version = _get_source_version(source, source)
+    image = _open_pil_image(source)
+    source_size = image.size
+    frame_count = getattr(image, 'n_frames', 1)
+    targets = _get_preview_targets(source_size, sizes, levels)
+
+    # Decode no more of the image than the largest preview needs
+    largest = max((size for _, size in targets),
+                  key=lambda size: size[0] * size[1])
+    if image.format == 'JPEG':
+        image.draft('RGB', largest)
+    if image.mode == 'P' and 'transparency' in image.info:
+        image = image.convert('RGBA')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    outputs = []
+    for name, size in targets:
+        preview = image
+        if image.size != size:
+            preview = image.resize(size, PILImage.LANCZOS, reducing_gap=3.0)
+        filename = f'{output_base}.{name}.png'
+        preview.save(filename, 'PNG', compress_level=1)
+        outputs.append({'file': os.path.relpath(filename, output_dir),
+                        'size': list(size)})
+    return {'version': list(version), 'source_size': list(source_size),
+            'frame_count': frame_count, 'sizes': [list(box) for box in sizes], 'levels': levels,
+            'outputs': outputs}
+
+
+def _is_up_to_date(entry, source, output_dir, sizes, levels):
+    """ Check whether the manifest entry for source still matches the
+    file and the options, and its previews all exist """
+    if entry is None:
+        return False
+    if (entry['sizes'] != [list(box) for box in sizes]
+            or entry['levels'] != levels):
+        return False
+    if entry['version'] != list(_get_source_version(source, source)):
+        return False
+    # Previews written before the fit was corrected are the wrong size
+    targets = _get_preview_targets(entry['source_size'], sizes, levels)
+    if [output['size'] for output in entry['outputs']] != [
+            list(size) for _, size in targets]:
+        return False
+    return all(os.path.exists(os.path.join(output_dir, output['file']))
+               for output in entry['outputs'])
+
+
+def _read_manifest(output_dir):
+    """ Load a batch manifest, or None if it is missing or bad """
+    try:
+        with open(os.path.join(output_dir, PREVIEW_MANIFEST),
+                  encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def batch(source_dir, output_dir, sizes=(BATCH_BOX_SIZE,), levels=0,
+          workers=None, force=False):
+    """ Write previews of every image under source_dir to output_dir.
+
+    Each image gets a preview fitted to each (width, height) box in sizes
+    and its first levels pyramid levels, as PNGs mirroring the source
+    tree. Images are processed in parallel on workers processes (all
+    cores by default). Images whose previews are already up to date are
+    skipped unless force is set. The manifest written alongside lets the
+    viewer use the previews as a warm cache (see set_preview_cache).
+
+    Returns counts of images written, skipped and failed, the time taken
+    and the throughput in images per second.
+    """
+    # Imported here as it pulls in multiprocessing, which slows down
+    # importing this module for everything else
+    from concurrent.futures import ProcessPoolExecutor
+    if not sizes and not levels:
+        raise ValueError('batch() needs at least one size or level')
+    source_dir = os.path.abspath(source_dir)
+    manifest = _read_manifest(output_dir)
+    if manifest is None or manifest.get('root') != source_dir:
+        manifest = {'root': source_dir, 'images': {}}
+    images = manifest['images']
+
+    sources = {os.path.relpath(source, source_dir): source
+               for source in _walk_image_files(
+                   source_dir, exclude=os.path.abspath(output_dir))}
+    for rel in [rel for rel in images if rel not in sources]:
+        del images[rel] # Source has gone
+
+    pending = {}
+    for rel, source in sources.items():
+        if not force and _is_up_to_date(images.get(rel), source, output_dir,
+                                        sizes, levels):
+            continue
+        output_base = os.path.join(output_dir, rel)
+        os.makedirs(os.path.dirname(output_base), exist_ok=True)
+        pending[rel] = (source, output_base, output_dir, sizes, levels)
+
+    failed = {}
+    start = time.perf_counter()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_write_previews, *task): rel
+                       for rel, task in pending.items()}
+            for future in as_completed(futures):
+                rel = futures[future]
+                try:
+                    images[rel] = future.result()
+                except Exception as error:
+                    images.pop(rel, None)
+                    failed[rel] = error
+    elapsed = time.perf_counter() - start
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_file = os.path.join(output_dir, PREVIEW_MANIFEST)
+    with open(manifest_file + '.part', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(manifest_file + '.part', manifest_file)
+
+    written = len(pending) - len(failed)
+    return {'written': written, 'skipped': len(sources) - len(pending),
+            'failed': failed, 'seconds': elapsed,
+            'images_per_second': written / elapsed if elapsed else 0.0}
+
+
+class _PreviewCache:
+    """ Previews written by batch(), used by _LoadJob in place of
+    decoding. Entries only match while the source file's version is the
+    one the previews were made from. """
+    def __init__(self, directory):
+        manifest = _read_manifest(directory)
+        if manifest is None:
+            raise ValueError(f'No preview manifest in {directory}')
+        self.directory = directory
+        self.root = manifest['root']
+        self.images = manifest['images']
+
+
+    def load(self, image_file, version, decode_size, source_size):
+        """ Decode the smallest stored preview of image_file that covers
+        decode_size, or failing that the largest one. Returns
+        (decoded, covers), or None if there is no usable preview. """
+        if image_file.startswith('http'):
+            return None
+        rel = os.path.relpath(os.path.abspath(image_file), self.root)
+        entry = self.images.get(rel)
+        if entry is None or entry['version'] != list(version):
+            return None
+        outputs = sorted(entry['outputs'],
+                         key=lambda output: output['size'][0] * output['size'][1])
+        if not outputs:
+            return None
+        output = outputs[-1]
+        for candidate in outputs:
+            if (candidate['size'][0] >= decode_size[0]
+                    and candidate['size'][1] >= decode_size[1]):
+                output = candidate
+                break
+        try:
+            image = _open_pil_image(os.path.join(self.directory, output['file']))
+            decoded = _pil_to_buffers(image, source_size=source_size)
+        except (OSError, ValueError): # Preview deleted or damaged
+            return None
+        decoded.frame_count = entry['frame_count']
+        covers = (decoded.width >= decode_size[0]
+                  and decoded.height >= decode_size[1])
+        return decoded, covers
+
+
+def set_preview_cache(directory):
+    """ Use the previews batch() wrote to directory as a warm cache, so
+    images it covers show without being decoded. None turns it off. """
+    global _preview_cache
+    _preview_cache = None if directory is None else _PreviewCache(directory)
+
+
+
+
+### Pixel statistics -------------------------------------------------------
+
+# Height in pixels of the histogram and min/max/mean panel
+STATS_PANEL_HEIGHT = 90
+
+# Tiles whose counts a panel keeps between statistics updates (enough for
+# every tile of a 256 MP image, now that they are counted at full size)
+STATS_MAX_TILES = 1024
+
+
+def _get_histogram(pixels):
+    """ Count the values of each channel of an (H, W, 3) uint8 array.
+    Returns a (3, 256) array of red, green and blue counts, from a single
+    bincount over the channels offset into their own ranges. """
+    import numpy as np
+    offsets = np.array([0, 256, 512], dtype=np.uint16)
+    values = pixels.astype(np.uint16) + offsets
+    return np.bincount(values.ravel(), minlength=768).reshape(3, 256)
+
+
+def _summarise_histogram(histogram):
+    """ Get count and per channel min, max and mean from a histogram made
+    by _get_histogram (or a sum of them) """
+    import numpy as np
+    count = int(histogram[0].sum())
+    if count == 0:
+        return None
+    present = histogram > 0
+    return {'count': count, 'histogram': histogram,
+            'min': tuple(int(v) for v in present.argmax(axis=1)),
+            'max': tuple(int(255 - v) for v in present[:, ::-1].argmax(axis=1)),
+            'mean': tuple(float(v) for v in histogram @ np.arange(256) / count)}
+
+
+class _StatsPanel(wx.Panel):
+    """ Shows the histogram and min/max/mean of the region in view """
+    def __init__(self, *args, **kw):
+        wx.Panel.__init__(self, *args, **kw)
+        self.stats = None
+        self.SetMinSize((-1, STATS_PANEL_HEIGHT))
+        self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+        self.Bind(wx.EVT_PAINT, self._on_paint)
+        self.Bind(wx.EVT_SIZE, self._on_size)
+
+
+    def show_stats(self, stats):
+        """ Display stats, as returned by _ViewerPanel.visible_stats """
+        self.stats = stats
+        self.Refresh()
+
+
+    def _on_size(self, event):
+        """ Redraw the histogram to the new width """
+        self.Refresh()
+
+
+    def _on_paint(self, event):
+        """ Draw min/max/mean as text with the histogram below it """
+        dc = wx.AutoBufferedPaintDC(self)
+        dc.SetBackground(wx.Brush(self.GetBackgroundColour()))
+        dc.Clear()
+        if self.stats is None:
+            return
+
+        stats = self.stats
+        mean = ', '.join(f'{value:.1f}' for value in stats['mean'])
+        text = (f"min {stats['min']}  max {stats['max']}  mean ({mean})")
+        if stats.get('approximate'):
+            text += '  (approx.)'
+
+        dc.DrawText(text, 4, 2)
+
+        # One line per channel, scaled to the tallest bin
+        width, height = self.GetClientSize()
+        top = dc.GetTextExtent(text)[1] + 6
+        plot_height = max(1, height - top - 2)
+        peak = max(1, int(stats['histogram'].max()))
+        colours = (wx.RED, wx.Colour(0, 160, 0), wx.BLUE)
+        for counts, colour in zip(stats['histogram'], colours):
+            dc.SetPen(wx.Pen(colour))
+            dc.DrawLines([wx.Point(int(i * (width - 1) / 255),
+                                   int(height - 2 - count * plot_height / peak))
+                          for i, count in enumerate(counts)])
+
+
+
+
+### Display adjustments ----------------------------------------------------
+
+# Channels that can be shown on their own, as grey
+_CHANNELS = {'r': 0, 'g': 1, 'b': 2}
+
+
+class _Adjustments:
+    """ Levels, gamma, channel isolation and inversion for display.
+
+    All of them are folded into one 256 entry lookup table, so adjusting
+    a tile is a single vectorised gather per pixel value whatever is
+    turned on. Black and white are the input values mapped to 0 and 255,
+    gamma above 1 brightens the mid tones, and channel ('r', 'g' or 'b')
+    shows that channel alone as grey. key identifies the setting in tile
+    cache keys.
+    """
+    def __init__(self, black=0, white=255, gamma=1.0, channel=None,
+                 invert=False):
+        if not 0 <= black < white <= 255:
+            raise ValueError('Levels need 0 <= black < white <= 255')
+        if gamma <= 0:
+            raise ValueError('Gamma must be positive')
+        if channel is not None and channel not in _CHANNELS:
+            raise ValueError(f'Unknown channel {channel!r}')
+        self.key = (black, white, float(gamma), channel, bool(invert))
+        self.is_identity = self.key == (0, 255, 1.0, None, False)
+        self._lut = None
+
+
+    def get_lut(self):
+        """ Get the lookup table as a uint8 array of 256 entries """
+        import numpy as np
+        if self._lut is None:
+            black, white, gamma, channel, invert = self.key
+            values = np.arange(256, dtype=np.float64)
+            values = np.clip((values - black) / (white - black), 0, 1)
+            values = 255 * values ** (1 / gamma)
+            if invert:
+                values = 255 - values
+            self._lut = np.round(values).astype(np.uint8)
+        return self._lut
+
+
+    def apply(self, image):
+        """ Return an adjusted copy of a wx.Image. image is only read. """
+        import numpy as np
+        width, height = image.GetWidth(), image.GetHeight()
+        pixels = np.frombuffer(image.GetDataBuffer(), dtype=np.uint8)
+        pixels = pixels.reshape(height, width, 3)
+        channel = self.key[3]
+        if channel is not None:
+            pixels = pixels[..., [_CHANNELS[channel]] * 3]
+        adjusted = self.get_lut()[pixels]
+        if image.HasAlpha():
+            alpha = bytes(image.GetAlphaBuffer()) # image may not outlive it
+            return wx.ImageFromBuffer(width, height, adjusted, alpha)
+        return wx.ImageFromBuffer(width, height, adjusted)
+
+
+class _AdjustPanel(wx.Panel):
+    """ Sliders for the display adjustments of one or more _ViewerPanels """
+    def __init__(self, viewer_panels, *args, **kw):
+        wx.Panel.__init__(self, *args, **kw)
+        self.viewer_panels = viewer_panels
+        self.black_slider = wx.Slider(self, value=0, minValue=0, maxValue=254)
+        self.white_slider = wx.Slider(self, value=255, minValue=1,
+                                      maxValue=255)
+        self.gamma_slider = wx.Slider(self, value=100, minValue=10,
+                                      maxValue=400) # Gamma x 100
+        self.channel_choice = wx.Choice(self, choices=['RGB', 'R', 'G', 'B'])
+        self.channel_choice.SetSelection(0)
+        self.invert_box = wx.CheckBox(self, label='Invert')
+        self.reset_btn = wx.Button(self, label='Reset', size=(50,30))
+
+        grid = wx.FlexGridSizer(cols=2, hgap=5, vgap=0)
+        grid.AddGrowableCol(1)
+        for label, slider in (('Black', self.black_slider),
+                              ('White', self.white_slider),
+                              ('Gamma', self.gamma_slider)):
+            grid.Add(wx.StaticText(self, label=label), 0,
+                     wx.ALIGN_CENTRE_VERTICAL)
+            grid.Add(slider, 1, wx.EXPAND)
+
+        options = wx.BoxSizer(wx.HORIZONTAL)
+        options.Add(self.channel_choice, 0, wx.ALL, 2)
+        options.Add(self.invert_box, 0, wx.ALL|wx.ALIGN_CENTRE_VERTICAL, 2)
+        options.Add(self.reset_btn, 0, wx.ALL, 2)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(grid, 0, wx.EXPAND|wx.LEFT|wx.RIGHT, 5)
+        sizer.Add(options, 0, wx.ALIGN_CENTRE)
+        self.SetSizer(sizer)
+
+        self.Bind(wx.EVT_SLIDER, self._on_change)
+        self.Bind(wx.EVT_CHOICE, self._on_change)
+        self.Bind(wx.EVT_CHECKBOX, self._on_change)
+        self.reset_btn.Bind(wx.EVT_BUTTON, self._on_reset)
+
+
+    def _on_change(self, event):
+        """ Pass the control values on to the viewer panel """
+        black = self.black_slider.GetValue()
+        white = max(black + 1, self.white_slider.GetValue())
+        channel = (None, 'r', 'g', 'b')[self.channel_choice.GetSelection()]
+        for viewer_panel in self.viewer_panels:
+            viewer_panel.set_adjustments(black, white,
+                                         self.gamma_slider.GetValue() / 100,
+                                         channel, self.invert_box.GetValue())
+
+
+    def _on_reset(self, event):
+        """ Put every control back to no adjustment """
+        self.black_slider.SetValue(0)
+        self.white_slider.SetValue(255)
+        self.gamma_slider.SetValue(100)
+        self.channel_choice.SetSelection(0)
+        self.invert_box.SetValue(False)
+        for viewer_panel in self.viewer_panels:
+            viewer_panel.set_adjustments()
+
+
+
+
+### Animation playback -----------------------------------------------------
+
+# Decoded frames an animation may get ahead of the frame on screen by
+ANIMATION_BUFFER_FRAMES = 4
+
+# Frame duration used when a file gives none, and the shortest honoured.
+# Browsers also slow down GIFs that ask for near zero frame times.
+ANIMATION_DEFAULT_FRAME_MS = 100
+ANIMATION_MIN_FRAME_MS = 20
+
+
+class _AnimationPlayer:
+    """ Plays the frames of an animated GIF or WebP into a panel.
+
+    A worker thread decodes frames in order, looping forever, into a
+    queue that holds at most buffer_frames of them. When the queue is
+    full the worker waits, so at most that many decoded frames exist at
+    once however long the animation is. A one shot timer on the main
+    thread takes the next frame when the current one's duration is up
+    and hands it, with its duration, to on_frame. Only the pixels are
+    decoded ahead: wx objects are created on the main thread as each
+    frame is shown (see _ViewerPanel._on_animation_frame).
+    """
+    def __init__(self, window, image_file, on_frame,
+                 buffer_frames=ANIMATION_BUFFER_FRAMES):
+        self.image_file = image_file
+        self.on_frame = on_frame
+        self.frames_shown = 0
+        self.frames_late = 0 # Frames the worker had not decoded in time
+        self._late = False
+        self._frames = queue.Queue(maxsize=buffer_frames)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._decode_frames,
+                                        name='image_inspector_animation',
+                                        daemon=True)
+        self._window = window
+        self._timer = wx.Timer(window)
+        window.Bind(wx.EVT_TIMER, self._on_timer, self._timer)
+
+
+    def start(self):
+        """ Start decoding, showing the first frame as soon as it is ready """
+        self._thread.start()
+        self._timer.StartOnce(ANIMATION_MIN_FRAME_MS)
+        return self
+
+
+    def stop(self):
+        """ Stop playback and let the worker thread finish """
+        self._stopped.set()
+        self._timer.Stop()
+        self._window.Unbind(wx.EVT_TIMER, self._timer)
+        try:
+            while True: # Unblock the worker and free the frames
+                self._frames.get_nowait()
+        except queue.Empty:
+            pass
+
+
+    def _decode_frames(self):
+        """ Decode frames into the queue (runs on the worker thread) """
+        try:
+            image = _open_pil_image(_read_image_source(self.image_file))
+            while not self._stopped.is_set():
+                for index in range(image.n_frames):
+                    image.seek(index)
+                    duration = (image.info.get('duration')
+                                or ANIMATION_DEFAULT_FRAME_MS)
+                    decoded = _pil_to_buffers(image)
+                    if not self._put((decoded, duration)):
+                        return
+        except Exception: # Keep showing what has been decoded so far
+            pass
+
+
+    def _put(self, frame):
+        """ Queue a frame, waiting for room. Returns False if stopped. """
+        while not self._stopped.is_set():
+            try:
+                self._frames.put(frame, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+    def _on_timer(self, event):
+        """ Current frame's time is up: show the next one """
+        if self._stopped.is_set():
+            return
+        try:
+            decoded, duration = self._frames.get_nowait()
+        except queue.Empty: # Worker is behind, check again shortly
+            if self.frames_shown and not self._late:
+                self.frames_late += 1
+                self._late = True
+            self._timer.StartOnce(ANIMATION_MIN_FRAME_MS)
+            return
+        self._late = False
+        self.frames_shown += 1
+        self.on_frame(decoded)
+        self._timer.StartOnce(max(ANIMATION_MIN_FRAME_MS, int(duration)))
+
+
+    def stats(self):
+        """ Return playback counters as a dict """
+        return {'shown': self.frames_shown, 'late': self.frames_late,
+                'buffered': self._frames.qsize()}
 
 
 
@@ -23,12 +2122,60 @@ from PIL import Image as PILImage
 ### Class _ViewerPanel (where all the action is!!) ----------------------
 
 class _ViewerPanel(wx.Panel):
-    """ Panel onto which the image is drawn """
-    def __init__(self, image_file, *args, **kw):
+    """ Panel onto which the image is drawn.
+    Panels created with link_to set to another _ViewerPanel share its pan
+    and zoom state and repaint scheduler, so they move together. """
+    def __init__(self, image_file, *args, link_to=None, **kw):
         wx.Panel.__init__(self, *args, **kw)
 
+        self.shared = None # _SharedImage being shown
+        self.render_cache = None
+        self.image_generation = 0 # Bumped whenever self.image is replaced
+        self.region_generation = 0 # Bumped as region tiles arrive
+        self.load_job = None
+        self.animation = None # _AnimationPlayer, for animated images
+        self._animation_tiles = None # Tile cache of the current frame
+        if link_to is None:
+            self.view = ViewTransform() # Pan and zoom state
+            self.repaint = _RepaintScheduler(self)
+        else:
+            self.view = link_to.view
+            self.repaint = link_to.repaint
+            self.repaint.add_window(self)
+
+        # FPS and frame cost overlay (see _draw_debug_overlay)
+        self.debug_overlay = DEBUG_OVERLAY
+        self._paint_times = deque(maxlen=30)
+
+        # Progressive rendering (see set_render_quality)
+        self.interactive_quality = INTERACTIVE_QUALITY
+        self.idle_quality = IDLE_QUALITY
+        self.idle_delay = IDLE_REPAINT_MS
+        self.interactive_level_offset = INTERACTIVE_LEVEL_OFFSET
+        self.interacting = False
+        self._idle_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self._on_idle_timer, self._idle_timer)
+
+        # Display adjustments (see set_adjustments)
+        self.adjustments = _Adjustments()
+
+        # Pixel readout and visible region statistics (see visible_stats).
+        # on_hover(text) and on_stats(stats) are set by whoever shows them.
+        self.on_hover = None
+        self.on_stats = None
+
+        # Called with a message in place of closing the frame when an image
+        # cannot be loaded, by owners that can show something else
+        self.on_load_failed = None
+        self._stats_key = None
+        self._tile_histograms = OrderedDict() # (generation, level, col, row)
+
+        # Last rendered frame, kept for scrolling (see _on_paint)
+        self._frame_buffer = None
+        self._spare_buffer = None
+        self._frame_key = None
+        self._frame_pan = (0, 0)
         self._init_graphics_attr(image_file)
-        self._init_vec_attr()
         self._set_bindings()
 
 
@@ -38,30 +2185,21 @@ class _ViewerPanel(wx.Panel):
     def _init_graphics_attr(self, image_file):
         """ Initialise window attributes related to graphics """
         self.image_file = image_file
-        self.image = self._load_image(self.image_file)
-        self.scaled_img_dims = (self.image.GetWidth(),
-                                self.image.GetHeight())
+        self.image = None # Placeholder is drawn until the load finishes
+        self.load_error = None # Message drawn instead if the load fails
+        self.pyramid = None
+        self.image_size = (1, 1) # Full resolution size of image_file
+        self.scaled_img_dims = self.image_size
+        self.upgrade_failed = False # Full resolution decode failed
         self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
-        self.zoom_factor = 1
-
-
-    def _init_vec_attr(self):
-        """ Initialise pan vector and related attributes """
-        self.pan_vec = np.array([0,0]) # Current pan position
-
-        # Pan start position (updated in _on_left_down to represent event position)
-        self.in_prog_start = np.array([0,0])
-
-        # Difference between pan_vec and actual pan position
-        self.in_prog_vec = np.array([0,0])
-
-        self.is_panning = False # Whether pan is currently in progress
+        self._load_image(self.image_file)
 
 
     def _set_bindings(self):
         """ Set permanent _ViewerPanel bindings """
         self.Bind(wx.EVT_SIZE, self._on_size)
         self.Bind(wx.EVT_PAINT, self._on_paint)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self._on_destroy)
 
         # Zoom bindings
         self.Bind(wx.EVT_LEFT_DCLICK, self._on_double_click)
@@ -75,6 +2213,10 @@ class _ViewerPanel(wx.Panel):
         # Reset binding
         self.Bind(wx.EVT_BUTTON, self._on_reset_button, id=3)
 
+        # Pixel readout bindings (panning binds EVT_MOTION on top of this)
+        self.Bind(wx.EVT_MOTION, self._on_hover)
+        self.Bind(wx.EVT_LEAVE_WINDOW, self._on_leave)
+
 
 
     ## Utility methods --------------------------------------------
@@ -87,58 +2229,152 @@ class _ViewerPanel(wx.Panel):
         return panel_centre
 
 
+    def _on_destroy(self, event):
+        """ Stop background work that would call back into this panel """
+        if event.GetEventObject() is self:
+            self.repaint.stop()
+            self.repaint.remove_window(self)
+            self._idle_timer.Stop()
+            self._stop_animation()
+            self.cancel_load()
+            self._release_image()
+        event.Skip()
+
+
     def _on_reset_button(self, event):
         """ Restore _ViewerPanel to initial state """
-        self._init_graphics_attr(self.image_file)
-        self._init_vec_attr()
-        self.Refresh()
+        if self.view.is_panning:
+            self._finish_pan(False)
+        self.view.reset()
+        self.repaint.request() # Repaints any linked panels too
 
 
 
     ## Load image functions -----------------------------------------------
 
-    def _process_image_file_name(self, image_file):
-        """ Standardise image file name """
-        filename = image_file.split('/')[-1] # Just filename with ext
-        filename = filename.split('.')[0] + '.png' # Replace extension
-        filename = os.path.join(os.path.dirname(__file__), 'temp', filename)
-        return filename
-
+    def _load_image(self, image_file):
+        """ Start loading image file in the background, at a resolution
+        to suit the size of the frame it will first be shown in """
+        self.cancel_load()
+        panel_size = wx.GetTopLevelParent(self).GetClientSize()
+        self.load_job = _LoadJob(image_file,
+                                 on_preview=self._on_image_decoded,
+                                 on_loaded=self._on_image_loaded,
+                                 on_failed=self._on_load_failed,
+                                 panel_size=panel_size).start()
+
+
+    def _load_full_resolution(self):
+        """ Decode the full resolution image in the background, once the
+        view is zoomed in past the resolution first decoded """
+        if self.load_job is not None or self.upgrade_failed:
+            return
+        self.load_job = _LoadJob(self.image_file,
+                                 on_preview=None,
+                                 on_loaded=self._on_image_loaded,
+                                 on_failed=self._on_upgrade_failed).start()
+
+
+    def show_image_file(self, image_file):
+        """ Switch to another image file, starting from the initial view """
+        if self.view.is_panning:
+            self._finish_pan(False)
+        self.view.reset()
+        self._stop_animation()
+        self._release_image()
+        self._init_graphics_attr(image_file)
+        # Linked panels share the view that was just reset, so they need
+        # redrawing too
+        self.repaint.request()
+
+
+    def cancel_load(self):
+        """ Abandon any load still in progress """
+        if self.load_job is not None:
+            self.load_job.cancel()
+            self.load_job = None
+
+
+    def _on_image_decoded(self, shared):
+        """ Show a decoded (preview or full) image """
+        self._release_image()
+        _image_cache.acquire(shared)
+        self.shared = shared
+        self.image = shared.image
+        self.image_size = shared.source_size
+        self.pyramid = shared.pyramid
+        self.render_cache = shared.render_cache
+        self.image_generation += 1
+        self.Refresh()
 
-    def _retrieve_image_from_web(self, image_file):
-        """ Load image file from internet as wx.Image object """
-        response = requests.get(image_file)
-        if response.status_code == 200: # Image successfully found
-            image_bytes = response.content            
-            image = PILImage.open(BytesIO(image_bytes))
-            return image
-        else:
-            raise Exception(f'Failed to retrieve image file {image_file}')
 
+    def _on_image_loaded(self, shared):
+        """ Show the image once the load has finished, and start playing
+        it if it is animated """
+        self.load_job = None
+        self._on_image_decoded(shared)
+        if shared.frame_count > 1 and self.animation is None:
+            self.animation = _AnimationPlayer(
+                self, self.image_file, self._on_animation_frame).start()
+
+
+    def _on_animation_frame(self, decoded):
+        """ Show the next frame of an animation.
+        Frames get a pyramid and tile cache of their own, replaced every
+        frame, so the shared first frame is left untouched and memory use
+        does not grow with the number of frames. Frames are full
+        resolution, so zooming in never needs a reload. """
+        self.image = decoded.to_wx_image()
+        self.pyramid = _ImagePyramid(self.image)
+        if self._animation_tiles is None:
+            self._animation_tiles = _RenderCache()
+        self._animation_tiles.clear()
+        self.render_cache = self._animation_tiles
+        self.image_generation += 1
+        self.repaint.request()
+
+
+    def _stop_animation(self):
+        """ Stop playing the current animation, if any """
+        if self.animation is not None:
+            self.animation.stop()
+            self.animation = None
+            self._animation_tiles = None
+
+
+    def _release_image(self):
+        """ Stop using the current shared image """
+        if self.shared is not None:
+            _image_cache.release(self.shared)
+            self.shared = None
+
+
+    def _on_load_failed(self, error):
+        """ Tell the user the image could not be loaded and close, unless
+        on_load_failed is set (then the message is drawn in the panel) """
+        self.load_job = None
+        message = f'Failed to retrieve image from {self.image_file}'
+        if self.on_load_failed is not None:
+            self.load_error = message
+            self.Refresh()
+            self.on_load_failed(message)
+            return
+        dlg = wx.MessageDialog(self, 
+                               message=message,
+                               caption='Could not find image',
+                               style=wx.ICON_WARNING)
+        dlg.ShowModal()
+        dlg.Destroy()
+        wx.GetTopLevelParent(self).Close()
 
-    def _load_image(self, image_file):
-        """ Load image file as wx.Image object """
-        frame = self.GetParent().GetParent()
-        
-        try:
-            if image_file.startswith('http'):
-                image = self._retrieve_image_from_web(image_file)
-            else:
-                image = PILImage.open(image_file)
-            filename = self._process_image_file_name(image_file)
-            image.save(filename, 'PNG')
-            frame.temp_file = filename
-            return wx.Image(filename)
 
-        except:
-            message = f'Failed to retrieve image from {image_file}'
-            dlg = wx.MessageDialog(self, 
-                                   message=message,
-                                   caption='Could not find image',
-                                   style=wx.ICON_WARNING)
-            dlg.ShowModal()
-            dlg.Destroy()
-            sys.exit('Image not found')
+    def _on_upgrade_failed(self, error):
+        """ Keep showing the reduced image when the full resolution decode
+        fails, and don't try it again for this image """
+        self.load_job = None
+        self.upgrade_failed = True
+        _log.warning('Failed to decode %s at full resolution: %s',
+                     self.image_file, error)
 
 
 
@@ -156,118 +2392,658 @@ class _ViewerPanel(wx.Panel):
         By default, the image drawing begins at the top left corner, hence
         need to calculate this position.
         """
-        # Get viewer panel centre position (width x height)
-        panel_centre_tuple = self._get_viewer_panel_centre()
-        panel_centre = np.array([panel_centre_tuple[0],
-                                 panel_centre_tuple[1]])
+        return fit_position(self.scaled_img_dims, self.GetSize())
 
-        # Get scaled image centre
-        image_centre = np.array([self.scaled_img_dims[0]/2,
-                                 self.scaled_img_dims[1]/2])
 
-        # Get draw start coordinates (panel centre - image_centre)
-        start_coords = panel_centre - image_centre
-
-        return (start_coords[0], start_coords[1])
+    def _update_placement(self):
+        """ Fit the image to the panel and tell the view where it is
+        drawn. Returns (width, height, start_coords) of the fitted image.
+        Linked panels share one view but may show images of different
+        sizes, so this is done before each use of the view's mapping. """
+        width, height = self._get_bitmap_size()
+        start_coords = self._get_bitmap_position()
+        self.view.set_placement(start_coords[0], start_coords[1],
+                                width / self.image_size[0])
+        return width, height, start_coords
 
 
     def _get_bitmap_size(self):
         """ Get display image dimensions based on panel height and width. """
+        self.scaled_img_dims = fit_size(self.image_size, self.GetSize())
+        return self.scaled_img_dims
 
-        # Get panel and scaled image dimensions
-        panel_width = self.GetSize()[0]
-        panel_height = self.GetSize()[1]
-        image_width = self.image.GetWidth()
-        image_height = self.image.GetHeight()
 
-        if image_height > panel_height or image_width > panel_width:
+    def _check_resolution(self, width):
+        """ Fetch the full resolution image if the view is zoomed in
+        beyond the resolution of the image currently decoded """
+        decoded_width = self.image.GetWidth()
+        if decoded_width >= self.image_size[0]:
+            return
+        if self.view.zoom_factor * width > decoded_width:
+            self._load_full_resolution()
+
+
+    def _get_region_level(self, width):
+        """ Get (source, level) to read tiles from, if the view is zoomed in
+        beyond the decoded image and the source can be read a region at a
+        time (see _RegionSource). level is picked like _get_zoom_bucket's,
+        but from a pyramid of the source. Otherwise None. """
+        regions = self.shared.regions if self.shared is not None else None
+        if regions is None:
+            return None
+        display_scale = self.view.zoom_factor * width / regions.size[0]
+        level = pyramid_level(display_scale, regions.max_level)
+        if regions.get_level_size(level)[0] <= self.image.GetWidth():
+            return None # No more detail than the decoded image
+        return regions, level
+
+
+    def _on_region_tiles_read(self):
+        """ Draw the region tiles that were read in the background """
+        if not self: # Destroyed while they were read
+            return
+        self.region_generation += 1
+        self.repaint.request()
+
+
+    def _get_zoom_bucket(self, width):
+        """ Get the pyramid level the image is shown at.
+        This is the smallest level that still has at least one pixel per
+        screen pixel. Zooming in never needs more than level 0.
+        """
+        display_scale = self.view.zoom_factor * width / self.image.GetWidth()
+        level = pyramid_level(display_scale, self.pyramid.max_level)
+        if self.interacting:
+            level = min(level + self.interactive_level_offset,
+                        self.pyramid.max_level)
+        return level
+
+
+    def _get_tile_rect(self, level_size, col, row):
+        """ Get the pixel rectangle of a tile within a pyramid level of
+        level_size pixels """
+        x = col * TILE_SIZE
+        y = row * TILE_SIZE
+        return wx.Rect(x, y,
+                       min(TILE_SIZE, level_size[0] - x),
+                       min(TILE_SIZE, level_size[1] - y))
+
+
+    def _get_visible_tiles(self, level_size, start_coords, width, height,
+                           area):
+        """ Get (col, row) of each tile of a level of level_size pixels
+        that overlaps area. area is a rectangle of the panel. It is mapped
+        back through the pan and zoom set up in _on_paint, then into pixels
+        of the pyramid level.
+        """
+        level_width, level_height = level_size
+
+        # Area corners in the coordinates the image is drawn in
+        left, top = self.view.screen_to_drawing(area.x, area.y)
+        right, bottom = self.view.screen_to_drawing(area.x + area.width,
+                                                    area.y + area.height)
+
+        # ... and in pixels of the pyramid level
+        scale_x = width / level_width
+        scale_y = height / level_height
+        x0 = (left - start_coords[0]) / scale_x
+        x1 = (right - start_coords[0]) / scale_x
+        y0 = (top - start_coords[1]) / scale_y
+        y1 = (bottom - start_coords[1]) / scale_y
+
+        # Clamp to the tiles the level actually has
+        last_col = (level_width - 1) // TILE_SIZE
+        last_row = (level_height - 1) // TILE_SIZE
+        first_col = max(0, int(math.floor(x0 / TILE_SIZE)))
+        first_row = max(0, int(math.floor(y0 / TILE_SIZE)))
+        end_col = min(last_col, int(math.floor(x1 / TILE_SIZE)))
+        end_row = min(last_row, int(math.floor(y1 / TILE_SIZE)))
+
+        return [(col, row)
+                for row in range(first_row, end_row + 1)
+                for col in range(first_col, end_col + 1)]
+
+
+    def _create_tile(self, gc, tile):
+        """ Convert one tile, a wx.Image, to a GraphicsBitmap """
+        with _timed('paint.convert'):
+            if not self.adjustments.is_identity:
+                tile = self.adjustments.apply(tile)
+            nbytes = tile.GetWidth() * tile.GetHeight() * 4
+            return gc.CreateBitmap(wx.Bitmap(tile)), nbytes
+
+
+    def _draw_placeholder(self, dc):
+        """ Draw a loading (or load failed) message while there is no
+        image yet """
+        dc.DrawLabel(self.load_error or 'Loading...', wx.Rect(self.GetSize()),
+                     wx.ALIGN_CENTRE)
+
+
+    def _draw_canvas(self, gc, area):
+        """ Draw the tiles of the image that overlap area of the panel """
+        placement = self._update_placement()
+        region_level = self._get_region_level(placement[0])
+        if region_level is None:
+            self._check_resolution(placement[0])
+            self._draw_pyramid_tiles(gc, area, placement)
+            return
+
+        # Detail read from the source, in the background. Tiles not read
+        # yet are covered by the decoded image drawn underneath.
+        regions, level = region_level
+        level_size = regions.get_level_size(level)
+        is_drawn = lambda tile: (('region', level), *tile,
+                                 self.adjustments.key) in self.render_cache
+        decoded = {tile: regions.get_tile(level, *tile)
+                   for tile in self._get_visible_tiles(
+                       level_size, placement[2], placement[0], placement[1],
+                       area)}
+        missing = [tile for tile, image in decoded.items()
+                   if image is None and not is_drawn(tile)]
+        if missing:
+            regions.request_tiles(level, missing, self._on_region_tiles_read)
+            self._draw_pyramid_tiles(gc, area, placement)
+
+        # Drawing can evict the bitmaps of tiles whose buffers have already
+        # left the region cache. Those are skipped and read again.
+        ready = [tile for tile, image in decoded.items()
+                 if image is not None or is_drawn(tile)]
+        evicted = self._draw_tiles(
+            gc, ('region', level), level_size, ready, placement,
+            lambda col, row: (decoded[col, row].to_wx_image()
+                              if decoded[col, row] is not None else None))
+        if evicted:
+            regions.request_tiles(level, evicted, self._on_region_tiles_read)
+
+
+    def _draw_pyramid_tiles(self, gc, area, placement):
+        """ Draw the tiles of the decoded image's pyramid that overlap area
+        of the panel """
+        width, height, start_coords = placement
+        level = self._get_zoom_bucket(width)
+        level_image = self.pyramid.get_level(level)
+        level_size = level_image.GetSize()
+        tiles = self._get_visible_tiles(level_size, start_coords, width,
+                                        height, area)
+        self._draw_tiles(gc, level, level_size, tiles, placement,
+                         lambda col, row: level_image.GetSubImage(
+                             self._get_tile_rect(level_size, col, row)))
+
+
+    def _draw_tiles(self, gc, level, level_size, tiles, placement, get_tile):
+        """ Draw tiles, (col, row) of a level of level_size pixels, from
+        the render cache, or from the wx.Image get_tile(col, row). Returns
+        the tiles skipped because get_tile returned None. """
+        width, height, start_coords = placement
+        scale_x = width / level_size[0]
+        scale_y = height / level_size[1]
+        skipped = []
+        for col, row in tiles:
+            key = (level, col, row, self.adjustments.key)
+            if key in self.render_cache:
+                tile = self.render_cache.get(key, None)
+            else:
+                image = get_tile(col, row)
+                if image is None:
+                    skipped.append((col, row))
+                    continue
+                tile = self.render_cache.get(
+                    key, lambda: self._create_tile(gc, image))
+            rect = self._get_tile_rect(level_size, col, row)
+            gc.DrawBitmap(tile,
+                          start_coords[0] + rect.x * scale_x,
+                          start_coords[1] + rect.y * scale_y,
+                          rect.width * scale_x, rect.height * scale_y)
+        return skipped
+
+
+    def _get_frame_key(self):
+        """ Get everything other than the pan that the last frame depends
+        on. The back buffer can only be scrolled if this is unchanged. """
+        size = self.GetClientSize()
+        return (self.image_generation, self.region_generation,
+                self.view.zoom_factor,
+                size.width, size.height, self._get_render_quality(),
+                self.adjustments.key)
+
+
+    def _scroll_frame(self, total_pan):
+        """ Scroll the last frame by the pan delta since it was drawn.
+        Returns the panel rectangles that were scrolled into view and still
+        need drawing, or None if the whole frame has to be redrawn.
+        """
+        if self._frame_buffer is None or self._get_frame_key() != self._frame_key:
+            return None
+
+        # The image moves opposite to the pan vector
+        dx = self._frame_pan[0] - total_pan[0]
+        dy = self._frame_pan[1] - total_pan[1]
+        # Can only blit whole pixels. Pans after a pinch zoom are arbitrary
+        # floats, so allow for rounding in the subtraction.
+        if (abs(dx - round(dx)) > SCROLL_TOLERANCE
+                or abs(dy - round(dy)) > SCROLL_TOLERANCE):
+            return None
+        dx, dy = int(round(dx)), int(round(dy))
+        width, height = self._frame_buffer.GetSize()
+        if abs(dx) >= width or abs(dy) >= height:
+            return None
+        if dx == 0 and dy == 0:
+            return []
+
+        # Blit into the spare buffer (blitting a bitmap onto itself is
+        # undefined where the areas overlap) and swap the two
+        source = wx.MemoryDC(self._frame_buffer)
+        target = wx.MemoryDC(self._spare_buffer)
+        target.Blit(dx, dy, width, height, source, 0, 0)
+        source.SelectObject(wx.NullBitmap)
+        target.SelectObject(wx.NullBitmap)
+        self._frame_buffer, self._spare_buffer = (self._spare_buffer,
+                                                  self._frame_buffer)
+
+        # Strips along the edges the image moved away from
+        exposed = []
+        if dx > 0:
+            exposed.append(wx.Rect(0, 0, dx, height))
+        elif dx < 0:
+            exposed.append(wx.Rect(width + dx, 0, -dx, height))
+        if dy > 0:
+            exposed.append(wx.Rect(0, 0, width, dy))
+        elif dy < 0:
+            exposed.append(wx.Rect(0, height + dy, width, -dy))
+        return exposed
+
+
+    def _render_frame(self, areas, total_pan):
+        """ Draw areas of the frame buffer, or all of it if areas is None """
+        size = self.GetClientSize()
+        if areas is None:
+            if self._frame_buffer is None or self._frame_buffer.GetSize() != size:
+                self._frame_buffer = wx.Bitmap(size.width, size.height)
+                self._spare_buffer = wx.Bitmap(size.width, size.height)
+            areas = [wx.Rect(size)]
+
+        dc = wx.MemoryDC(self._frame_buffer)
+        dc.SetBackground(wx.Brush(self.GetBackgroundColour()))
+        for area in areas:
+            dc.SetClippingRegion(area)
+            dc.Clear()
+            dc.DestroyClippingRegion()
+
+        # Create graphics context from Memory DC
+        gc = wx.GraphicsContext.Create(dc)
+        if gc:
+            gc.SetInterpolationQuality(self._get_render_quality()[0])
+            with _timed('paint.draw'):
+                for area in areas:
+                    gc.PushState()
+                    gc.Clip(area.x, area.y, area.width, area.height)
 
-            # If original image is larger in any dimension than the panel,
-            # check what % larger each dimension of image is than panel,
-            # and scale down both dimensions by the larger % difference.
-            # Do not directly scale original image. Return only scaled
-            # image dimensions.
+                    # Position view according to pan
+                    gc.Translate(-total_pan[0], -total_pan[1])
 
-            prop_diff_width = (image_width - panel_width) / panel_width
-            prop_diff_height = (image_height - panel_height) / panel_height
-            scale = max(prop_diff_width, prop_diff_height)
+                    # Scale x and y axes equally according to zoom factor
+                    gc.Scale(self.view.zoom_factor, self.view.zoom_factor)
 
-            self.scaled_img_dims = (image_width/scale, image_height/scale)
+                    self._draw_canvas(gc, area)
+                    gc.PopState()
+                    gc.ResetClip()
 
-            # If the either of the scaled image dimensions exceed original
-            # image size, reset scaled image dimensions to original image
-            # dimensions
-            if self.scaled_img_dims[0] > image_width or self.scaled_img_dims[1] > image_height:
-                self.scaled_img_dims = (image_width, image_height)
+        del gc
+        dc.SelectObject(wx.NullBitmap)
+        self._frame_key = self._get_frame_key()
+        self._frame_pan = (total_pan[0], total_pan[1])
 
-        else:
 
-            # The image fits neatly in the panel. Use original image
-            # dimensions as scaled image dimensions.
-            self.scaled_image_dims = (image_width, image_height)
+    def _on_paint(self, event):
+        """ Prepare to draw on _ViewerPanel.
+        The frame is rendered into a back buffer that is kept between
+        paints. When only the pan has changed, the old frame is scrolled
+        by the pan delta and just the newly exposed strips are drawn.
+        """
+        start = time.perf_counter()
+        dc = wx.PaintDC(self)
+        size = self.GetClientSize()
+        if size.width <= 0 or size.height <= 0:
+            return
+
+        if self.image is None:
+            self._frame_key = None
+            dc.SetBackground(wx.Brush(self.GetBackgroundColour()))
+            dc.Clear()
+            self._draw_placeholder(dc)
+            return
+
+        total_pan = self.view.total_pan()
+        areas = self._scroll_frame(total_pan)
+        if areas is None or areas:
+            self._render_frame(areas, total_pan)
+        dc.DrawBitmap(self._frame_buffer, 0, 0)
+
+        elapsed = time.perf_counter() - start
+        if _instrumentation.enabled:
+            _instrumentation.record('paint.frame', elapsed)
+        if self.debug_overlay:
+            self._draw_debug_overlay(dc, elapsed)
+
+        # Statistics wait until the view settles (see _on_idle_timer)
+        if self.on_stats is not None and not self.interacting:
+            stats_key = (self._frame_key, self._frame_pan)
+            if stats_key != self._stats_key:
+                self._stats_key = stats_key
+                wx.CallAfter(self._update_stats)
+
+
+    def set_debug_overlay(self, show):
+        """ Show or hide the FPS and frame cost overlay """
+        self.debug_overlay = show
+        self._paint_times.clear()
+        self.Refresh()
+
 
-        return self.scaled_img_dims
+    def _draw_debug_overlay(self, dc, elapsed):
+        """ Draw FPS (over the last few paints) and the cost of this paint
+        in the top left corner. Drawn straight onto the window rather than
+        the back buffer, so scrolling never moves it. """
+        now = time.perf_counter()
+        self._paint_times.append(now)
+        fps = 0.0
+        if len(self._paint_times) > 1:
+            span = now - self._paint_times[0]
+            if span > 0:
+                fps = (len(self._paint_times) - 1) / span
+        text = f'{fps:.0f} fps  {elapsed * 1000:.1f} ms'
+        width, height = dc.GetTextExtent(text)
+        dc.SetBrush(wx.Brush(wx.Colour(0, 0, 0, 160)))
+        dc.SetPen(wx.TRANSPARENT_PEN)
+        dc.DrawRectangle(0, 0, width + 8, height + 4)
+        dc.SetTextForeground(wx.WHITE)
+        dc.DrawText(text, 4, 2)
+    
+    
+    
+    ### Render quality -------------------------------------------------
+
+    def set_render_quality(self, interactive=None, idle=None,
+                           idle_delay=None, level_offset=None):
+        """ Configure progressive rendering.
+        interactive and idle are wx.INTERPOLATION_* qualities used while
+        the view is being panned or zoomed and once input has been idle
+        for idle_delay ms. level_offset is how many pyramid levels coarser
+        than needed to draw from while interacting. Arguments left as
+        None are unchanged.
+        """
+        if interactive is not None:
+            self.interactive_quality = interactive
+        if idle is not None:
+            self.idle_quality = idle
+        if idle_delay is not None:
+            self.idle_delay = idle_delay
+        if level_offset is not None:
+            self.interactive_level_offset = level_offset
+        self.Refresh()
 
 
-    def _draw_canvas(self, gc):
-        """ Draw image onto _ViewerPanel """
-        image = gc.CreateBitmap(wx.Bitmap(self.image))
-        width, height = self._get_bitmap_size()
-        start_coords = self._get_bitmap_position()
-        gc.DrawBitmap(image, start_coords[0], start_coords[1],
-                      width, height)
+    def _get_render_quality(self):
+        """ Get (interpolation, level offset) for the next frame """
+        if self.interacting:
+            return (self.interactive_quality, self.interactive_level_offset)
+        return (self.idle_quality, 0)
 
 
-    def _on_paint(self, event):
-        """ Prepare to draw on _ViewerPanel """
-        # Initialise paint device context
-        dc = wx.AutoBufferedPaintDC(self)
-        dc.Clear()
+    def _note_interaction(self):
+        """ Render this panel, and any linked to it, at interactive
+        quality until input has been idle for idle_delay ms """
+        for panel in self.repaint.windows:
+            panel.interacting = True
+            panel._idle_timer.StartOnce(panel.idle_delay)
 
-        # Create graphics context from Paint DC
-        gc = wx.GraphicsContext.Create(dc)
-        if gc:
-            # Position view according to pan
-            total_pan = self.pan_vec + self.in_prog_vec
-            gc.Translate(-total_pan[0], -total_pan[1])
 
-            # Scale x and y axes equally according to zoom factor
-            gc.Scale(self.zoom_factor, self.zoom_factor)
+    def _on_idle_timer(self, event):
+        """ Input has gone idle: draw the view once more at idle quality.
+        The quality is part of the frame key, so this is a full redraw
+        rather than a scroll of the last frame. """
+        self.interacting = False
+        self.repaint.request()
+
+
+
+    ### Display adjustment methods -------------------------------------
+
+    def set_adjustments(self, black=0, white=255, gamma=1.0, channel=None,
+                        invert=False):
+        """ Change the levels, gamma, channel isolation and inversion the
+        image is shown with (see _Adjustments). The image itself is never
+        changed: tiles are adjusted as they are drawn, and cached under
+        the setting, so going back to an earlier setting is all cache
+        hits. Calling with no arguments removes every adjustment.
+        """
+        self.adjustments = _Adjustments(black, white, gamma, channel, invert)
+        self._note_interaction() # Slider drags render like a pan
+        self.repaint.request()
+
+
+
+    ### Pixel inspection methods ---------------------------------------
+
+    def _on_hover(self, event):
+        """ Report the source pixel under the cursor """
+        event.Skip()
+        if self.on_hover is None or self.image is None:
+            return
+        x, y = event.GetPosition()
+        self._update_placement()
+        image_x, image_y = self.view.screen_to_image(x, y)
+        if not (0 <= image_x < self.image_size[0]
+                and 0 <= image_y < self.image_size[1]):
+            self.on_hover(None)
+            return
+        self.on_hover(self._describe_pixel(int(image_x), int(image_y)))
+
+
+    def _on_leave(self, event):
+        """ Clear the readout when the cursor leaves the panel """
+        event.Skip()
+        if self.on_hover is not None:
+            self.on_hover(None)
+
+
+    def _describe_pixel(self, image_x, image_y):
+        """ Get the readout for a pixel, given in source image coordinates.
+        The value is the source pixel when it is in memory: the decoded
+        image is full resolution, or the region tile holding it has been
+        read. Otherwise it comes from the reduced decode and is marked as
+        approximate. """
+        red, green, blue, alpha = self._get_source_pixel(image_x, image_y)
+        exact = red is not None
+        if not exact:
+            image = self.image
+            x = min(image.GetWidth() - 1,
+                    int(image_x * image.GetWidth() / self.image_size[0]))
+            y = min(image.GetHeight() - 1,
+                    int(image_y * image.GetHeight() / self.image_size[1]))
+            red, green, blue = (image.GetRed(x, y), image.GetGreen(x, y),
+                                image.GetBlue(x, y))
+            alpha = image.GetAlpha(x, y) if image.HasAlpha() else None
+        text = f'({image_x}, {image_y})  R {red}  G {green}  B {blue}'
+        if alpha is not None:
+            text += f'  A {alpha}'
+        if not exact:
+            text += '  (approx.)'
+        return text
+
+
+    def _get_source_pixel(self, image_x, image_y):
+        """ Get (red, green, blue, alpha) of a source pixel, if it is in
+        memory. Otherwise all of them are None. """
+        image = self.image
+        if image.GetWidth() == self.image_size[0]:
+            alpha = image.GetAlpha(image_x, image_y) if image.HasAlpha() else None
+            return (image.GetRed(image_x, image_y),
+                    image.GetGreen(image_x, image_y),
+                    image.GetBlue(image_x, image_y), alpha)
+        regions = self.shared.regions if self.shared is not None else None
+        if regions is not None:
+            col, x = divmod(image_x, TILE_SIZE)
+            row, y = divmod(image_y, TILE_SIZE)
+            tile = regions.get_tile(0, col, row)
+            if tile is not None:
+                return tile.get_pixel(x, y)
+        return None, None, None, None
+
+
+    def request_stats(self):
+        """ Recompute the visible region statistics at the next paint """
+        self._stats_key = None
+        self.Refresh()
+
+
+    def _update_stats(self):
+        """ Pass fresh statistics to on_stats """
+        if not self or self.on_stats is None: # Destroyed or turned off
+            return
+        self.on_stats(self.visible_stats())
+
+
+    def visible_stats(self):
+        """ Get statistics of the RGB values of the pixels in view.
+
+        Returns a dict with the pixel count, a (3, 256) histogram array,
+        per channel min, max and mean, and whether they are approximate,
+        or None if nothing is in view. They are computed on the source
+        pixels when those are in memory (see _get_stats_level), and
+        otherwise on the pyramid level being drawn, whose box averaging
+        can hide extreme pixels. Counts are summed per tile, and those of
+        tiles wholly in view are kept, so after a pan only the tiles along
+        the edges are counted again.
+        """
+        import numpy as np
+        if self.image is None:
+            return None
+
+        # Part of the image in view, in source pixels
+        size = self.GetClientSize()
+        left, top = self.view.screen_to_image(0, 0)
+        right, bottom = self.view.screen_to_image(size.width, size.height)
+        level, level_size, get_tile_pixels, exact = self._get_stats_level(
+            (left, top, right, bottom))
+        level_width, level_height = level_size
+
+        # ... and in pixels of the level
+        scale = level_width / self.image_size[0]
+        x0 = max(0, int(left * scale))
+        y0 = max(0, int(top * scale))
+        x1 = min(level_width, int(math.ceil(right * scale)))
+        y1 = min(level_height, int(math.ceil(bottom * scale)))
+        if x0 >= x1 or y0 >= y1:
+            return None
+
+        # Counts of tiles from earlier images are no use any more
+        generation = self.image_generation
+        for key in [key for key in self._tile_histograms
+                    if key[0] != generation]:
+            del self._tile_histograms[key]
+
+        histogram = np.zeros((3, 256), dtype=np.int64)
+        for row in range(y0 // TILE_SIZE, (y1 - 1) // TILE_SIZE + 1):
+            for col in range(x0 // TILE_SIZE, (x1 - 1) // TILE_SIZE + 1):
+                rect = self._get_tile_rect(level_size, col, row)
+                left = max(x0, rect.x)
+                top = max(y0, rect.y)
+                right = min(x1, rect.x + rect.width)
+                bottom = min(y1, rect.y + rect.height)
+                whole = (right - left, bottom - top) == (rect.width,
+                                                         rect.height)
+                key = (generation, level, col, row)
+                counts = self._tile_histograms.get(key) if whole else None
+                if counts is None:
+                    pixels = get_tile_pixels(col, row)
+                    counts = _get_histogram(
+                        pixels[top - rect.y:bottom - rect.y,
+                               left - rect.x:right - rect.x])
+                    if whole:
+                        self._tile_histograms[key] = counts
+                else:
+                    self._tile_histograms.move_to_end(key)
+                histogram += counts
+        while len(self._tile_histograms) > STATS_MAX_TILES:
+            self._tile_histograms.popitem(last=False)
+        stats = _summarise_histogram(histogram)
+        if stats is not None:
+            stats['approximate'] = not exact
+        return stats
+
+
+    def _get_stats_level(self, box):
+        """ Get the pixels statistics of box (in source pixels) are
+        computed on, as (level, level_size, get_tile_pixels, exact).
+        get_tile_pixels(col, row) returns the (H, W, 3) array of a tile.
+        This is the decoded image if it is full resolution, the region
+        tiles if every one box overlaps has been read, or else the
+        pyramid level being drawn (which is not exact). """
+        import numpy as np
+        image = self.image
+        regions = self.shared.regions if self.shared is not None else None
+        if image.GetWidth() != self.image_size[0] and regions is not None:
+            col0 = max(0, int(box[0]) // TILE_SIZE)
+            row0 = max(0, int(box[1]) // TILE_SIZE)
+            col1 = min((regions.size[0] - 1) // TILE_SIZE,
+                       int(math.ceil(box[2])) // TILE_SIZE)
+            row1 = min((regions.size[1] - 1) // TILE_SIZE,
+                       int(math.ceil(box[3])) // TILE_SIZE)
+            tiles = {(col, row): regions.get_tile(0, col, row)
+                     for row in range(row0, row1 + 1)
+                     for col in range(col0, col1 + 1)}
+            if tiles and None not in tiles.values():
+                def get_tile_pixels(col, row):
+                    tile = tiles[col, row]
+                    return np.frombuffer(tile.data, dtype=np.uint8).reshape(
+                        tile.height, tile.width, 3)
+                return ('region', 0), regions.size, get_tile_pixels, True
+
+        exact = image.GetWidth() == self.image_size[0]
+        level = 0 if exact else self._get_zoom_bucket(
+            self._update_placement()[0])
+        level_image = self.pyramid.get_level(level)
+        level_width, level_height = level_image.GetSize()
+
+        # Zero copy view of the level's pixels
+        pixels = np.frombuffer(level_image.GetDataBuffer(), dtype=np.uint8)
+        pixels = pixels.reshape(level_height, level_width, 3)
+        def get_tile_pixels(col, row):
+            rect = self._get_tile_rect((level_width, level_height), col, row)
+            return pixels[rect.y:rect.y + rect.height,
+                          rect.x:rect.x + rect.width]
+        return level, (level_width, level_height), get_tile_pixels, exact
+
 
-            self._draw_canvas(gc)
 
-        del gc
-    
-    
-    
     ### Pan methods ----------------------------------------------------
 
-    def _process_pan(self, position, do_refresh):
+    def _process_pan(self, x, y, do_refresh):
         """ Update in progress vector then refresh display """
-        self.in_prog_vec = self.in_prog_start - position
+        self.view.update_pan(x, y)
+        self._note_interaction()
         if do_refresh:
-            self.Refresh()
+            self.repaint.request()
 
 
     def _finish_pan(self, do_refresh):
         """ Restore attributes and bindings to pre-panning state """
         # Restore cursor to arrow and release mouse capture
-        if self.is_panning:
+        if self.view.is_panning:
             self.SetCursor(wx.Cursor(wx.CURSOR_ARROW))
         if self.HasCapture():
             self.ReleaseMouse()
 
-        # Remove bindings associated with left mouse down
+        # Remove bindings associated with left mouse down (but not the
+        # pixel readout's motion binding)
         self.Unbind(wx.EVT_LEFT_UP)
-        self.Unbind(wx.EVT_MOTION)
+        self.Unbind(wx.EVT_MOTION, handler=self._on_motion)
         self.Unbind(wx.EVT_MOUSE_CAPTURE_LOST)
 
-        # Update pan vector
-        self.pan_vec += self.in_prog_vec
-
-        # Restore self.in_prog_vec and self.is_panning
-        self.in_prog_vec = np.array([0,0])
-        self.is_panning = False
+        # Add the in progress vector to the pan vector and clear it
+        self.view.finish_pan()
 
         # Refresh viewer panel if required
         if do_refresh: self.Refresh()
@@ -275,17 +3051,16 @@ class _ViewerPanel(wx.Panel):
 
     def _on_left_up(self, event):
         """ Process last pan event then finish pan """
-        event_position = np.array([event.GetPosition()[0],
-                                   event.GetPosition()[1]])
-        self._process_pan(event_position, False)
+        x, y = event.GetPosition()
+        self._process_pan(x, y, False)
         self._finish_pan(False)
 
 
     def _on_motion(self, event):
         """ Signal to process current pan event """
-        event_position = np.array([event.GetPosition()[0],
-                                   event.GetPosition()[1]])
-        self._process_pan(event_position, True)
+        with _timed('event.motion'):
+            x, y = event.GetPosition()
+            self._process_pan(x, y, True)
 
 
     def _on_capture_lost(self, event):
@@ -300,11 +3075,9 @@ class _ViewerPanel(wx.Panel):
         cursor = wx.Cursor(wx.CURSOR_HAND)
         self.SetCursor(cursor)
 
-        # Initialise class pan attributes
-        self.in_prog_start = np.array([event.GetPosition()[0],
-                                       event.GetPosition()[1]])
-        self.in_prog_vec = np.array([0,0])
-        self.is_panning = True
+        # Initialise pan attributes
+        x, y = event.GetPosition()
+        self.view.begin_pan(x, y)
 
         # Set bindings
         self.Bind(wx.EVT_LEFT_UP, self._on_left_up)
@@ -318,29 +3091,25 @@ class _ViewerPanel(wx.Panel):
 
     ### Zoom methods ---------------------------------------------------
 
-    def _on_zoom(self, old_zoom, new_zoom, evt_pos):
-        """ Set self.pan_vec such that the point below the cursor (i.e,
-        evt_pos) is the new absolute pan site """
-
-        # Convert evt_pos from tuple to numpy array
-        pos = np.array([evt_pos[0], evt_pos[1]])
-
-        # Add pos to self.pan_vec
-        st_pt = self.pan_vec + pos
-
-        # I don't fully understand how this works but it works
-        xy_pt = st_pt / old_zoom
-        new_st_pt = xy_pt * new_zoom
-        self.pan_vec = new_st_pt - pos
-
-        self.Refresh()
+    def _on_zoom(self, new_zoom, evt_pos):
+        """ Zoom such that the point below the cursor (i.e, evt_pos)
+        stays where it is """
+        self.view.zoom_to(new_zoom, evt_pos[0], evt_pos[1])
+        self._note_interaction()
+        self.repaint.request()
 
 
     def _on_zoom_gesture(self, event):
         """ Process pinch zoom gesture """
-        if self.is_panning: 
+        with _timed('event.zoom_gesture'):
+            self._process_zoom_gesture(event)
+
+
+    def _process_zoom_gesture(self, event):
+        """ Apply a pinch zoom gesture to the view """
+        if self.view.is_panning: 
             self._finish_pan(False)
-        old_zoom = self.zoom_factor
+        old_zoom = self.view.zoom_factor
         new_zoom_factor = event.GetZoomFactor()
 
         # Smooth out sudden zoom factor shifts
@@ -350,31 +3119,24 @@ class _ViewerPanel(wx.Panel):
             else: # Zooming in
                 new_zoom_factor = old_zoom + 2
 
-        self.zoom_factor = new_zoom_factor
-        self._on_zoom(old_zoom, self.zoom_factor, event.GetPosition())
+        self._on_zoom(new_zoom_factor, event.GetPosition())
 
 
     def _on_double_click(self, event):
         """ Zoom in by 50% """
-        old_zoom = self.zoom_factor
-        self.zoom_factor = old_zoom * 1.5
-        self._on_zoom(old_zoom, self.zoom_factor, event.GetPosition())
+        self._on_zoom(self.view.zoom_factor * 1.5, event.GetPosition())
 
 
     def _on_zoom_out_button(self, event):
         """ Zoom out by 50% """
-        old_zoom = self.zoom_factor
-        self.zoom_factor = old_zoom * 0.5
         centre = self._get_viewer_panel_centre()
-        self._on_zoom(old_zoom, self.zoom_factor, centre)
+        self._on_zoom(self.view.zoom_factor * 0.5, centre)
 
 
     def _on_zoom_in_button(self, event):
         """ Zoom in by 50% """
-        old_zoom = self.zoom_factor
-        self.zoom_factor = old_zoom * 1.5
         centre = self._get_viewer_panel_centre()
-        self._on_zoom(old_zoom, self.zoom_factor, centre)
+        self._on_zoom(self.view.zoom_factor * 1.5, centre)
 
 
 
@@ -382,53 +3144,223 @@ class _ViewerPanel(wx.Panel):
 ### ImageInspector class supporting _ViewerPanel ----------------------------------
 
 class ImageInspectorPanel(wx.Panel):
-    """ ImageInspector panel to support _ViewerPanel and Zoom buttons """
+    """ ImageInspector panel to support _ViewerPanel and Zoom buttons.
+    image_file may also be a list, directory or glob pattern, in which
+    case previous/next buttons (and the arrow keys) step through it.
+
+    Each file in compare_with is shown in another view beside the first,
+    with pan and zoom linked to it, for side by side comparison. The
+    buttons, navigation and statistics act on the first view; display
+    adjustments apply to every view.
+    """
 
-    def __init__(self, image_file, *args, **kw):
+    def __init__(self, image_file, *args, prefetch_radius=PREFETCH_RADIUS,
+                 prefetch_max_bytes=PREFETCH_MAX_BYTES, compare_with=(),
+                 **kw):
         super().__init__(*args, **kw)
-        self.image_file = image_file
+        self.image_files = _expand_image_files(image_file)
+        if not self.image_files:
+            raise ValueError(f'No image files found in {image_file}')
+        self.compare_files = list(compare_with)
+        self.index = 0
+        self.image_file = self.image_files[self.index]
+        self.prefetcher = _Prefetcher(self.image_files,
+                                      radius=prefetch_radius,
+                                      max_bytes=prefetch_max_bytes)
         self._init_ui()
         self._set_bindings()
+        self._prefetch()
 
 
     def _init_ui(self):
         """ Add _ViewerPanel and Zoom button widgets to self """
 
         # Create panel components
-        viewer_panel = _ViewerPanel(image_file=self.image_file,
+        self.viewer_panel = viewer_panel = _ViewerPanel(image_file=self.image_file,
                                    parent=self,
                                    id=wx.ID_ANY)
+        self.viewer_panels = [viewer_panel] + [
+            _ViewerPanel(image_file=compare_file, parent=self, id=wx.ID_ANY,
+                         link_to=viewer_panel)
+            for compare_file in self.compare_files]
         self.zoom_out_btn = wx.Button(self, label='-',
                                       size=(30,30), id=1)
         self.zoom_in_btn = wx.Button(self, label='+',
                                      size=(30,30), id=2)
         self.reset_btn = wx.Button(self, label='Reset',
                                       size=(30,30), id=3)
-
-        # Add viewer panel to main sizer
+        self.prev_btn = wx.Button(self, label='<', size=(30,30))
+        self.next_btn = wx.Button(self, label='>', size=(30,30))
+        self.stats_btn = wx.ToggleButton(self, label='Stats', size=(50,30))
+        self.adjust_btn = wx.ToggleButton(self, label='Adjust', size=(50,30))
+
+        # Histogram panel, hidden until the stats button is pressed
+        self.stats_panel = _StatsPanel(self)
+        self.stats_panel.Hide()
+        self.adjust_panel = _AdjustPanel(self.viewer_panels, self)
+        self.adjust_panel.Hide()
+        for panel in self.viewer_panels:
+            panel.on_hover = self._on_hover
+        if len(self.image_files) > 1: # Keep going past unreadable files
+            viewer_panel.on_load_failed = self._on_load_failed
+
+        # Add viewer panels side by side, then stats panels, to main sizer
+        views_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        for panel in self.viewer_panels:
+            views_sizer.Add(panel, 1, wx.EXPAND|wx.LEFT|wx.RIGHT,
+                            1 if self.compare_files else 0)
         main_sizer = wx.BoxSizer(wx.VERTICAL)
-        main_sizer.Add(viewer_panel, 20, wx.EXPAND)
+        main_sizer.Add(views_sizer, 20, wx.EXPAND)
+        main_sizer.Add(self.stats_panel, 0, wx.EXPAND)
+        main_sizer.Add(self.adjust_panel, 0, wx.EXPAND)
 
         # Add zoom buttons to button sizer
         btn_sizer = wx.BoxSizer(wx.HORIZONTAL)
         btn_sizer.Add(self.zoom_out_btn, 0, wx.ALL, 5)
         btn_sizer.Add(self.zoom_in_btn, 0, wx.ALL, 5)
 
+        # Add navigation buttons to navigation sizer (only shown when
+        # there is more than one image)
+        nav_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        nav_sizer.Add(self.prev_btn, 0, wx.ALL, 5)
+        nav_sizer.Add(self.next_btn, 0, wx.ALL, 5)
+        if len(self.image_files) == 1:
+            self.prev_btn.Hide()
+            self.next_btn.Hide()
+
         # Add items to bottom bar
         bottom_sizer = wx.BoxSizer(wx.HORIZONTAL)
         bottom_sizer.Add(btn_sizer, 2, wx.ALL, 5)
         bottom_sizer.Add(self.reset_btn, 1, wx.ALL|wx.ALIGN_CENTRE, 5)
+        bottom_sizer.Add(self.stats_btn, 1, wx.ALL|wx.ALIGN_CENTRE, 5)
+        bottom_sizer.Add(self.adjust_btn, 1, wx.ALL|wx.ALIGN_CENTRE, 5)
+        bottom_sizer.Add(nav_sizer, 2, wx.ALL, 5)
 
         # Finalise main sizer
         main_sizer.Add(bottom_sizer, 1, wx.ALIGN_CENTRE, 5)
         self.SetSizer(main_sizer)
+        self._update_nav_buttons()
 
 
     def _set_bindings(self):
-        """ Bind zoom buttons to their event handlers """
+        """ Bind buttons and keys to their event handlers """
         self.zoom_out_btn.Bind(wx.EVT_BUTTON, self._on_zoom_out)
         self.zoom_in_btn.Bind(wx.EVT_BUTTON, self._on_zoom_in)
         self.reset_btn.Bind(wx.EVT_BUTTON, self._on_reset)
+        self.prev_btn.Bind(wx.EVT_BUTTON, self._on_prev)
+        self.next_btn.Bind(wx.EVT_BUTTON, self._on_next)
+        self.stats_btn.Bind(wx.EVT_TOGGLEBUTTON, self._on_stats_toggle)
+        self.adjust_btn.Bind(wx.EVT_TOGGLEBUTTON, self._on_adjust_toggle)
+        self.Bind(wx.EVT_CHAR_HOOK, self._on_char_hook)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self._on_destroy)
+
+
+    def _on_destroy(self, event):
+        """ Stop prefetching when the panel goes away """
+        if event.GetEventObject() is self:
+            self.prefetcher.cancel()
+        event.Skip()
+
+
+
+    ## Navigation methods -------------------------------------------
+
+    def go_to(self, index):
+        """ Show the image at index in the list of image files """
+        index = max(0, min(index, len(self.image_files) - 1))
+        if index == self.index:
+            return
+        self.index = index
+        self.image_file = self.image_files[index]
+        self.viewer_panel.show_image_file(self.image_file)
+        self._update_nav_buttons()
+        self._prefetch()
+
+
+    def _prefetch(self):
+        """ Start decoding the images around the current one """
+        panel_size = wx.GetTopLevelParent(self).GetClientSize()
+        self.prefetcher.update(self.index, panel_size)
+
+
+    def _update_nav_buttons(self):
+        """ Enable the buttons that lead somewhere and update the title """
+        self.prev_btn.Enable(self.index > 0)
+        self.next_btn.Enable(self.index < len(self.image_files) - 1)
+        if len(self.image_files) > 1:
+            title = (f'{_prune_title(self.image_file)} '
+                     f'({self.index + 1}/{len(self.image_files)})')
+            wx.GetTopLevelParent(self).SetTitle(title)
+
+
+    def _on_load_failed(self, message):
+        """ Report an unreadable image in the status bar, leaving the
+        navigation working so the user can step past it """
+        self._on_hover(message)
+
+
+    def _on_prev(self, event):
+        """ Step back to the previous image """
+        self.go_to(self.index - 1)
+
+
+    def _on_next(self, event):
+        """ Step on to the next image """
+        self.go_to(self.index + 1)
+
+
+    def _on_char_hook(self, event):
+        """ Step through the images with the arrow keys. Char hooks see
+        keys before the focused control does, so they are passed on when
+        there is nothing to step through or an adjustment control has
+        focus (sliders and choices use the arrow keys themselves). """
+        key = event.GetKeyCode()
+        if (key not in (wx.WXK_LEFT, wx.WXK_RIGHT)
+                or len(self.image_files) < 2 or self._is_adjusting()):
+            event.Skip()
+        elif key == wx.WXK_LEFT:
+            self.go_to(self.index - 1)
+        else:
+            self.go_to(self.index + 1)
+
+
+    def _is_adjusting(self):
+        """ Whether keyboard focus is in the display adjustment panel """
+        window = wx.Window.FindFocus()
+        while window is not None:
+            if window is self.adjust_panel:
+                return True
+            window = window.GetParent()
+        return False
+
+
+
+    ## Pixel inspection methods -------------------------------------
+
+    def _on_hover(self, text):
+        """ Show the pixel readout in the frame's status bar, if any """
+        frame = wx.GetTopLevelParent(self)
+        if isinstance(frame, wx.Frame) and frame.GetStatusBar() is not None:
+            frame.SetStatusText(text or '')
+
+
+    def _on_stats_toggle(self, event):
+        """ Show or hide the visible region statistics """
+        show = self.stats_btn.GetValue()
+        self.stats_panel.Show(show)
+        if show:
+            self.viewer_panel.on_stats = self.stats_panel.show_stats
+            self.viewer_panel.request_stats()
+        else:
+            self.viewer_panel.on_stats = None
+        self.Layout()
+
+
+    def _on_adjust_toggle(self, event):
+        """ Show or hide the display adjustment sliders """
+        self.adjust_panel.Show(self.adjust_btn.GetValue())
+        self.Layout()
+
 
 
     def _on_zoom_out(self, event):
@@ -459,16 +3391,22 @@ class ImageInspectorPanel(wx.Panel):
 class ImageInspector(wx.Frame):
     """ ImageInspector frame to support ImageInspector Panel """
 
-    def __init__(self, image_file, *args, **kw):
+    def __init__(self, image_file, *args, prefetch_radius=PREFETCH_RADIUS,
+                 prefetch_max_bytes=PREFETCH_MAX_BYTES, compare_with=(),
+                 **kw):
         wx.Frame.__init__(self, *args, **kw)
-        
-        # Must call before panel is instantiated so app can close if 
-        # panel instantiation fails
-        self.temp_file = None
         self.Bind(wx.EVT_CLOSE, self._on_exit) 
-        
-        panel = ImageInspectorPanel(image_file=image_file, parent=self,
-                          id=wx.ID_ANY)
+
+        # Status bar shows the pixel under the cursor. Created first, as
+        # the panel sizes its first decodes (and prefetches) to the client
+        # area left over.
+        self.CreateStatusBar()
+
+        self.panel = ImageInspectorPanel(image_file=image_file, parent=self,
+                                         id=wx.ID_ANY,
+                                         prefetch_radius=prefetch_radius,
+                                         prefetch_max_bytes=prefetch_max_bytes,
+                                         compare_with=compare_with)
 
         # Set frame size limits
         self.SetMinSize((300,300))
@@ -479,9 +3417,10 @@ class ImageInspector(wx.Frame):
 
 
     def _on_exit(self, event):
-        """ Discard temp image file if present before closing """
-        if self.temp_file is not None:
-            os.remove(self.temp_file)
+        """ Cancel any unfinished loads before closing """
+        for viewer_panel in self.panel.viewer_panels:
+            viewer_panel.cancel_load()
+        self.panel.prefetcher.cancel()
         self.Destroy()
 
 
@@ -489,34 +3428,115 @@ class ImageInspector(wx.Frame):
 
 ### Execution functions -------------------------------------------------
 
+_image_handlers_ready = False
+
+
+def _init_image_handlers():
+    """ Initialise wx image handlers, once per process """
+    global _image_handlers_ready
+    if not _image_handlers_ready:
+        wx.InitAllImageHandlers()
+        _image_handlers_ready = True
+
+
 def _prune_title(image_path):
     """ Extracts just the filename from an image file path """
     return image_path.split('/')[-1]
 
 
-def view(parent, image_file):
+def view(parent, image_file, prefetch_radius=PREFETCH_RADIUS,
+         prefetch_max_bytes=PREFETCH_MAX_BYTES, compare_with=()):
     """ Open and run image viewer, which will display given image file.
     This function should be called from a currently running wxpython app.
+    image_file may also be a list of files, a directory or a glob pattern,
+    which can then be stepped through; prefetch_radius images either side
+    of the current one are decoded ahead, holding at most
+    prefetch_max_bytes between them. Files in compare_with are shown
+    beside it, panning and zooming together with it.
     """
-    wx.InitAllImageHandlers()
-    title = _prune_title(image_file)    
-    base = ImageInspector(image_file=image_file, parent=parent,
+    _init_image_handlers()
+    image_files = _expand_image_files(image_file)
+    if not image_files:
+        raise ValueError(f'No image files found in {image_file}')
+    title = ' | '.join(_prune_title(name)
+                       for name in [image_files[0], *compare_with])
+    base = ImageInspector(image_file=image_files, parent=parent,
                 id=wx.ID_ANY, title=title,
-                pos=wx.DefaultPosition, size=(400,300),
-                style=wx.DEFAULT_FRAME_STYLE)
+                pos=wx.DefaultPosition,
+                size=(400 * (1 + len(compare_with)), 300),
+                style=wx.DEFAULT_FRAME_STYLE,
+                prefetch_radius=prefetch_radius,
+                prefetch_max_bytes=prefetch_max_bytes,
+                compare_with=compare_with)
 
 
 
-def main(image_file):
+def main(image_file, compare_with=()):
     """ Initialises wx app to use ImageInspector """
     app = wx.App(False)
-    wx.InitAllImageHandlers()
-    title = _prune_title(image_file)
+    _init_image_handlers()
+    title = ' | '.join(_prune_title(name)
+                       for name in [image_file, *compare_with])
     base = ImageInspector(image_file=image_file, parent=None,
                 id=wx.ID_ANY, title=title,
-                pos=wx.DefaultPosition, size=(400,300),
-                style=wx.DEFAULT_FRAME_STYLE)
+                pos=wx.DefaultPosition,
+                size=(400 * (1 + len(compare_with)), 300),
+                style=wx.DEFAULT_FRAME_STYLE,
+                compare_with=compare_with)
     app.MainLoop()
 
+
+def _parse_box(text):
+    """ Parse a WIDTHxHEIGHT command line size """
+    width, _, height = text.lower().partition('x')
+    return (int(width), int(height))
+
+
+def cli(argv=None):
+    """ Command line entry point: view an image, or with --batch write
+    previews of a whole folder tree """
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('image', nargs='?', default='images/medium.jpg',
+                        help='image to view, or with --batch the folder '
+                             'of images to process')
+    parser.add_argument('--batch', metavar='OUTPUT_DIR',
+                        help='write previews to OUTPUT_DIR instead of '
+                             'opening the viewer')
+    parser.add_argument('--size', type=_parse_box, action='append',
+                        metavar='WxH',
+                        help='box to fit previews to (repeatable, default '
+                             '%dx%d)' % BATCH_BOX_SIZE)
+    parser.add_argument('--levels', type=int, default=0,
+                        help='also write this many pyramid levels')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: all cores)')
+    parser.add_argument('--force', action='store_true',
+                        help='rewrite previews that are up to date')
+    parser.add_argument('--compare', action='append', default=[],
+                        metavar='FILE',
+                        help='show FILE beside the image with linked pan '
+                             'and zoom (repeatable)')
+    parser.add_argument('--preview-cache', metavar='DIR',
+                        help='show previews written by --batch to DIR '
+                             'while viewing')
+    args = parser.parse_args(argv)
+
+    if args.batch is None:
+        if args.preview_cache:
+            set_preview_cache(args.preview_cache)
+        main(args.image, compare_with=args.compare)
+        return
+
+    result = batch(args.image, args.batch,
+                   sizes=args.size or [BATCH_BOX_SIZE], levels=args.levels,
+                   workers=args.workers, force=args.force)
+    for rel, error in sorted(result['failed'].items()):
+        print(f'failed: {rel}: {error}')
+    print(f"{result['written']} images in {result['seconds']:.2f}s "
+          f"({result['images_per_second']:.1f} images/s), "
+          f"{result['skipped']} up to date, {len(result['failed'])} failed")
+
+
 if __name__ == '__main__':
-    main('images/medium.jpg')
+    cli()
@@ -0,0 +1,232 @@
+"""
+Unit tests for ImageInspector: the pan and zoom geometry, the headless
+renderer and the HTTP download cache. Run with
+
+    python -m pytest test_image_inspector.py
+
+Tests that need packages which are not installed (wx, numpy, pillow,
+requests) are skipped.
+"""
+
+import http.server
+import os
+import threading
+
+import pytest
+
+try:
+    from .view_transform import (ViewTransform, fit_position, fit_size,
+                                 pyramid_level)
+except ImportError: # Run as a top level module rather than in a package
+    from view_transform import (ViewTransform, fit_position, fit_size,
+                                pyramid_level)
+
+
+
+
+### Geometry ----------------------------------------------------------------
+
+def test_fit_size_shrinks_to_the_tighter_side():
+    """ Images larger than the panel are scaled to fit inside it """
+    assert fit_size((4000, 3000), (400, 300)) == (400, 300)
+    assert fit_size((800, 600), (400, 300)) == (400, 300)
+    assert fit_size((1000, 100), (400, 300)) == (400, 40)
+    assert fit_size((300, 600), (400, 300)) == (150, 300)
+
+
+def test_fit_size_never_enlarges():
+    """ Images that already fit are shown at their own size """
+    assert fit_size((100, 50), (400, 300)) == (100, 50)
+    assert fit_size((400, 300), (400, 300)) == (400, 300)
+
+
+def test_fit_position_centres_the_image():
+    """ The fitted image's centre is on the panel's centre """
+    assert fit_position((200, 100), (400, 300)) == (100, 100)
+
+
+@pytest.mark.parametrize('display_scale, level', [
+    (4, 0), (1, 0), (0.9, 0), (0.5, 1), (0.3, 1), (0.25, 2), (0.01, 5)])
+def test_pyramid_level(display_scale, level):
+    """ The level drawn from has at least one pixel per screen pixel """
+    assert pyramid_level(display_scale, max_level=5) == level
+
+
+def test_view_transform_round_trip():
+    """ Mapping to the screen and back gives the same image position """
+    view = ViewTransform()
+    view.set_placement(10, 20, 0.5)
+    view.zoom_to(3, 50, 40)
+    view.begin_pan(0, 0)
+    view.update_pan(-7, 11)
+    x, y = view.screen_to_image(*view.image_to_screen(123, 45))
+    assert x == pytest.approx(123)
+    assert y == pytest.approx(45)
+
+
+def test_zoom_to_keeps_the_point_under_the_cursor():
+    """ The drawing point under the zoom position stays put """
+    view = ViewTransform()
+    before = view.screen_to_drawing(120, 80)
+    view.zoom_to(2.5, 120, 80)
+    assert view.screen_to_drawing(120, 80) == pytest.approx(before)
+
+
+def test_pan_commits_and_resets():
+    """ A finished drag moves the committed pan, and reset clears it """
+    view = ViewTransform()
+    view.begin_pan(100, 100)
+    view.update_pan(90, 130)
+    assert view.total_pan() == (10, -30)
+    view.finish_pan()
+    assert (view.pan_x, view.pan_y, view.is_panning) == (10, -30, False)
+    view.reset()
+    assert view.total_pan() == (0, 0) and view.zoom_factor == 1
+
+
+
+
+### Headless rendering ------------------------------------------------------
+
+def _halves_image(size):
+    """ RGB array whose left half is red and right half is blue """
+    np = pytest.importorskip('numpy')
+    width, height = size
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    pixels[:, :width // 2, 0] = 255
+    pixels[:, width // 2:, 2] = 255
+    return pixels
+
+
+def test_render_view_fits_and_centres():
+    """ A small image is drawn at its own size in the panel centre """
+    pytest.importorskip('PIL')
+    headless = _import_headless()
+    pixels = headless.render_view(_halves_image((200, 100)), (400, 300))
+    assert pixels.shape == (300, 400, 3)
+    assert tuple(pixels[150, 150]) == (255, 0, 0) # Left half
+    assert tuple(pixels[150, 250]) == (0, 0, 255) # Right half
+    assert tuple(pixels[50, 200]) == (0, 0, 0) # Above the image
+    assert tuple(pixels[150, 50]) == (0, 0, 0) # Left of the image
+
+
+def test_render_view_zoom_and_pan():
+    """ Zooming in on the left half shows only red """
+    pytest.importorskip('PIL')
+    headless = _import_headless()
+    image = _halves_image((400, 300))
+    pixels = headless.render_view(image, (400, 300), zoom=4, pan=(0, 450))
+    assert (pixels[..., 0] == 255).all() and (pixels[..., 2] == 0).all()
+
+
+def test_render_views_matches_render_view():
+    """ Batched views come out the same as views rendered one by one """
+    np = pytest.importorskip('numpy')
+    pytest.importorskip('PIL')
+    headless = _import_headless()
+    image = _halves_image((1600, 1200))
+    views = [((400, 300), 1, (0, 0)), ((400, 300), 3, (250, 120)),
+             ((200, 200), 0.5, (-40, 10))]
+    batch = headless.render_views(image, views)
+    for view, pixels in zip(views, batch):
+        np.testing.assert_array_equal(pixels,
+                                      headless.render_view(image, *view))
+
+
+def _import_headless():
+    """ Import headless the same way as view_transform above """
+    try:
+        from . import headless
+    except ImportError:
+        import headless
+    return headless
+
+
+
+
+### HTTP cache --------------------------------------------------------------
+
+class _ImageHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves the server's bodies, by path, with an ETag each, and
+    answers a matching If-None-Match with 304 """
+    def do_GET(self):
+        body = self.server.bodies.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        etag = f'"{len(body)}-{self.path}"'
+        self.server.requests.append((self.path,
+                                     self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, *args):
+        pass # Keep test output quiet
+
+
+@pytest.fixture
+def server():
+    """ Local HTTP server standing in for an image host """
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _ImageHandler)
+    httpd.bodies = {'/a.png': b'a' * 1000, '/b.png': b'b' * 1000,
+                    '/c.png': b'c' * 1000}
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f'http://127.0.0.1:{httpd.server_address[1]}'
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _make_fetcher(cache_dir, max_bytes=1024 * 1024):
+    """ Get an _HttpFetcher caching into cache_dir """
+    pytest.importorskip('wx')
+    pytest.importorskip('requests')
+    try:
+        from . import image_inspector
+    except ImportError:
+        import image_inspector
+    return image_inspector._HttpFetcher(cache_dir=str(cache_dir),
+                                        max_bytes=max_bytes)
+
+
+def test_fetch_downloads_into_the_cache(server, tmp_path):
+    """ A 200 response is streamed to a file holding the body """
+    fetcher = _make_fetcher(tmp_path)
+    path = fetcher.fetch(server.url + '/a.png')
+    with open(path, 'rb') as file:
+        assert file.read() == server.bodies['/a.png']
+    assert fetcher.stats()['bytes_downloaded'] == 1000
+
+
+def test_fetch_revalidates_and_serves_304_from_disk(server, tmp_path):
+    """ A cached URL is fetched with its ETag, and a 304 reuses the file """
+    fetcher = _make_fetcher(tmp_path)
+    first = fetcher.fetch(server.url + '/a.png')
+    second = fetcher.fetch(server.url + '/a.png')
+    assert second == first
+    assert server.requests[0][1] is None
+    assert server.requests[1][1] is not None # Conditional GET
+    stats = fetcher.stats()
+    assert stats['bytes_downloaded'] == 1000
+    assert stats['bytes_from_cache'] == 1000
+
+
+def test_fetch_evicts_least_recently_used(server, tmp_path):
+    """ Once over max_bytes, the oldest URL and its file are dropped """
+    fetcher = _make_fetcher(tmp_path, max_bytes=2500)
+    first = fetcher.fetch(server.url + '/a.png')
+    fetcher.fetch(server.url + '/b.png')
+    fetcher.fetch(server.url + '/c.png')
+    assert not os.path.exists(first)
+    assert fetcher.stats()['cached_urls'] == 2
+    assert fetcher.stats()['cached_bytes'] == 2000
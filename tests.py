@@ -64,8 +64,8 @@ class TestFrame(wx.Frame):
 
     def on_close(self, event):
         """ Inform ImageInspector frames the main app is closing. 
-        This ensures temp image files are tidied up. Not including
-        this section could lead to data bloat.
+        This ensures unfinished background loads are cancelled. Not
+        including this section could leave loads running after exit.
         """
         test_panel = self.GetChildren()[0]
         for child in test_panel.GetChildren():
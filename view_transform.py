@@ -0,0 +1,193 @@
+"""
+Pan, zoom and fit geometry used by ImageInspector.
+
+Kept free of wx (and, outside the batch methods, of numpy) so that it is
+cheap to use from mouse event handlers and can be used and tested
+without a display. headless.py renders views with the same geometry.
+"""
+
+import math
+
+
+
+
+### Fitting -----------------------------------------------------------------
+
+def fit_size(image_size, panel_size):
+    """ Get display image dimensions based on panel height and width. """
+
+    # Get panel and scaled image dimensions
+    panel_width, panel_height = panel_size[0], panel_size[1]
+    image_width, image_height = image_size[0], image_size[1]
+
+    # If original image is larger in any dimension than the panel, scale
+    # both dimensions down by whichever ratio fits that dimension in.
+    # Otherwise it fits neatly in the panel, so use the original image
+    # dimensions. Do not directly scale original image. Return only
+    # scaled image dimensions.
+    scale = min(panel_width / image_width, panel_height / image_height, 1)
+    return (image_width * scale, image_height * scale)
+
+
+def fit_position(scaled_img_dims, panel_size):
+    """ Get where the fitted image starts so that its centre is on the
+    panel centre """
+    return (panel_size[0] / 2 - scaled_img_dims[0] / 2,
+            panel_size[1] / 2 - scaled_img_dims[1] / 2)
+
+
+def pyramid_level(display_scale, max_level):
+    """ Get the pyramid level an image shown at display_scale (screen
+    pixels per image pixel) is drawn from. This is the smallest level
+    that still has at least one pixel per screen pixel, where each level
+    is half the size of the one below. """
+    if display_scale >= 1:
+        return 0
+    level = int(math.floor(-math.log2(display_scale)))
+    return min(level, max_level)
+
+
+
+
+### View transform ----------------------------------------------------------
+
+
+
+
+class ViewTransform:
+    """ Affine view transform (uniform scale plus translation) holding
+    the pan and zoom state of one view.
+
+    There are three coordinate spaces:
+    - image: pixels of the source image
+    - drawing: the space the fitted image is drawn in before pan and
+      zoom, where the image sits at origin and is fit_scale times its
+      pixel size (see set_placement)
+    - screen: pixels of the panel
+
+    A drawing point p appears on screen at p * zoom_factor - pan, where
+    pan is the committed pan plus the drag in progress. Every mapping is
+    a handful of float operations on plain attributes, so handling a
+    mouse event creates no arrays.
+    """
+    __slots__ = ('zoom_factor', 'pan_x', 'pan_y', 'drag_start_x',
+                 'drag_start_y', 'drag_x', 'drag_y', 'is_panning',
+                 'origin_x', 'origin_y', 'fit_scale')
+
+    def __init__(self):
+        self.origin_x = 0.0
+        self.origin_y = 0.0
+        self.fit_scale = 1.0
+        self.reset()
+
+
+    def reset(self):
+        """ Return to the initial, unpanned and unzoomed view """
+        self.zoom_factor = 1
+        self.pan_x = 0 # Committed pan position
+        self.pan_y = 0
+        self.drag_start_x = 0 # Where the pan in progress started
+        self.drag_start_y = 0
+        self.drag_x = 0 # Pan in progress, on top of the committed pan
+        self.drag_y = 0
+        self.is_panning = False
+
+
+
+    ## Pan and zoom ----------------------------------------------------
+
+    def total_pan(self):
+        """ Get the pan including any drag in progress, as (x, y) """
+        return (self.pan_x + self.drag_x, self.pan_y + self.drag_y)
+
+
+    def begin_pan(self, x, y):
+        """ Start a drag at screen position (x, y) """
+        self.drag_start_x = x
+        self.drag_start_y = y
+        self.drag_x = 0
+        self.drag_y = 0
+        self.is_panning = True
+
+
+    def update_pan(self, x, y):
+        """ Move the drag in progress to screen position (x, y) """
+        self.drag_x = self.drag_start_x - x
+        self.drag_y = self.drag_start_y - y
+
+
+    def finish_pan(self):
+        """ Commit the drag in progress to the pan position """
+        self.pan_x += self.drag_x
+        self.pan_y += self.drag_y
+        self.drag_x = 0
+        self.drag_y = 0
+        self.is_panning = False
+
+
+    def zoom_to(self, zoom_factor, x, y):
+        """ Change the zoom, keeping the drawing point under screen
+        position (x, y) where it is """
+        # Drawing point under (x, y), scaled by the new zoom, gives the
+        # pan that puts it back under (x, y)
+        scale = zoom_factor / self.zoom_factor
+        self.pan_x = (self.pan_x + x) * scale - x
+        self.pan_y = (self.pan_y + y) * scale - y
+        self.zoom_factor = zoom_factor
+
+
+
+    ## Coordinate mapping ----------------------------------------------
+
+    def set_placement(self, origin_x, origin_y, fit_scale):
+        """ Set where the fitted image sits in drawing coordinates and how
+        many drawing units one image pixel takes up """
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+        self.fit_scale = fit_scale
+
+
+    def screen_to_drawing(self, x, y):
+        """ Map a screen position to drawing coordinates """
+        pan_x, pan_y = self.total_pan()
+        return ((x + pan_x) / self.zoom_factor,
+                (y + pan_y) / self.zoom_factor)
+
+
+    def _image_affine(self):
+        """ Get (scale, tx, ty) such that screen = image * scale + t """
+        pan_x, pan_y = self.total_pan()
+        scale = self.zoom_factor * self.fit_scale
+        return (scale,
+                self.origin_x * self.zoom_factor - pan_x,
+                self.origin_y * self.zoom_factor - pan_y)
+
+
+    def image_to_screen(self, x, y):
+        """ Map an image pixel position to a screen position """
+        scale, tx, ty = self._image_affine()
+        return (x * scale + tx, y * scale + ty)
+
+
+    def screen_to_image(self, x, y):
+        """ Map a screen position to an image pixel position """
+        scale, tx, ty = self._image_affine()
+        return ((x - tx) / scale, (y - ty) / scale)
+
+
+    def image_to_screen_many(self, points):
+        """ Map an (N, 2) array-like of image positions to screen
+        positions in one vectorised step. Returns a float numpy array. """
+        import numpy as np
+        scale, tx, ty = self._image_affine()
+        points = np.asarray(points, dtype=np.float64)
+        return points * scale + np.array([tx, ty])
+
+
+    def screen_to_image_many(self, points):
+        """ Map an (N, 2) array-like of screen positions to image
+        positions in one vectorised step. Returns a float numpy array. """
+        import numpy as np
+        scale, tx, ty = self._image_affine()
+        points = np.asarray(points, dtype=np.float64)
+        return (points - np.array([tx, ty])) / scale